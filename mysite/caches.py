@@ -0,0 +1,32 @@
+from django.core.cache.backends import locmem, memcached
+
+from web.metrics import record_cache_gets
+
+
+MISSING = object()
+
+
+class MeteredCacheMixin:
+    """Counts the hits and misses of the cache reads for /metrics."""
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, MISSING, version)
+        if value is MISSING:
+            record_cache_gets(0, 1)
+            return default
+        record_cache_gets(1, 0)
+        return value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        values = super().get_many(keys, version)
+        record_cache_gets(len(values), len(keys) - len(values))
+        return values
+
+
+class PyMemcacheCache(MeteredCacheMixin, memcached.PyMemcacheCache):
+    pass
+
+
+class LocMemCache(MeteredCacheMixin, locmem.LocMemCache):
+    pass
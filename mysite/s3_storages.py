@@ -0,0 +1,43 @@
+from storages.backends.s3boto3 import S3Boto3Storage, S3ManifestStaticStorage
+from storages.utils import clean_name
+
+from .storages import CONTENT_NAME_RE, HASHED_NAME_RE, BundleMixin
+
+
+class MediaStore(S3Boto3Storage):
+    location = 'media'
+    file_overwrite = False
+
+    def presigned_upload(self, name, content_type, max_size, expires=3600):
+        """URL and form fields letting a browser POST one file straight to the bucket."""
+        return self.bucket.meta.client.generate_presigned_post(
+            self.bucket_name,
+            self._normalize_name(clean_name(name)),
+            Fields={'Content-Type': content_type},
+            Conditions=[{'Content-Type': content_type}, ['content-length-range', 1, max_size]],
+            ExpiresIn=expires,
+        )
+
+    def read_header(self, name, size):
+        # a ranged GET, opening the file would download all of it
+        obj = self.bucket.Object(self._normalize_name(clean_name(name)))
+        return obj.get(Range='bytes=0-{}'.format(size - 1))['Body'].read()
+
+    def get_object_parameters(self, name):
+        params = super().get_object_parameters(name)
+        if CONTENT_NAME_RE.search(name):
+            # a new content gets a new name
+            params['CacheControl'] = 'public, max-age=31536000, immutable'
+        return params
+
+
+class S3StaticStore(BundleMixin, S3ManifestStaticStorage):
+    """Static files served straight from the bucket, gzipped on upload."""
+    location = 'static'
+    gzip = True
+
+    def get_object_parameters(self, name):
+        params = super().get_object_parameters(name)
+        if HASHED_NAME_RE.search(name):
+            params['CacheControl'] = 'public, max-age=31536000, immutable'
+        return params
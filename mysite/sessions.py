@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.contrib.sessions.backends.base import CreateError
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+from django.contrib.sessions.models import Session
+from django.utils import timezone
+
+
+CLEANUP_CHUNK_SIZE = 1000
+
+
+class SessionStore(CachedDBStore):
+    """
+    Sessions live in the shared cache. With SESSION_DB_WRITE_THROUGH they are
+    also written to the database, which is then only read on a cache miss.
+    A session that was marked modified but still holds the data it was
+    loaded with is not written at all.
+    """
+    cache_key_prefix = 'mysite.sessions'
+
+    def __init__(self, session_key=None):
+        super().__init__(session_key)
+        self._loaded_data = None
+
+    def load(self):
+        data = super().load()
+        self._loaded_data = self.serializer().dumps(data)
+        return data
+
+    def save(self, must_create=False):
+        if self.session_key is None:
+            return self.create()
+        if not must_create and self._loaded_data == self.serializer().dumps(self._get_session()):
+            return
+        if settings.SESSION_DB_WRITE_THROUGH:
+            return super().save(must_create)
+        if must_create:
+            if not self._cache.add(self.cache_key, self._get_session(no_load=True), self.get_expiry_age()):
+                raise CreateError
+        else:
+            self._cache.set(self.cache_key, self._get_session(), self.get_expiry_age())
+
+    @classmethod
+    def clear_expired(cls, chunk_size=CLEANUP_CHUNK_SIZE):
+        """
+        Delete expired database sessions in chunks of primary keys, so no
+        single statement holds locks on a large part of the table.
+        Returns the number of deleted sessions.
+        """
+        now = timezone.now()
+        deleted = 0
+        while True:
+            keys = list(
+                Session.objects.filter(expire_date__lt=now).values_list('session_key', flat=True)[:chunk_size]
+            )
+            if not keys:
+                return deleted
+            deleted += Session.objects.filter(session_key__in=keys).delete()[0]
@@ -12,7 +12,7 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = cfg('SECRET_KEY')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = cfg('DEBUG')
+DEBUG = cfg('DEBUG', default=False, cast=bool)
 
 ALLOWED_HOSTS = ['127.0.0.1', '.herokuapp.com']
 
@@ -28,7 +28,6 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'web',
 
-    'multiselectfield',
     'crispy_forms',
     'storages',
 ]
@@ -36,6 +35,8 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'web.metrics.MetricsMiddleware',
+    'web.cdn.SurrogateKeyMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -64,6 +65,8 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'mysite.wsgi.application'
+# Compile templates and fill the process caches when a worker starts, see web.warmup
+WARM_UP = cfg('WARM_UP', default=True, cast=bool)
 
 
 # Database
@@ -105,6 +108,54 @@ EMAIL_PORT = 465
 EMAIL_USE_SSL = True
 
 
+# Cache and sessions
+# Memcached servers shared by all dynos, e.g. 'host1:11211,host2:11211'
+MEMCACHED_LOCATION = cfg('MEMCACHED_LOCATION', default='')
+if MEMCACHED_LOCATION:
+    CACHES = {
+        'default': {
+            'BACKEND': 'mysite.caches.PyMemcacheCache',
+            'LOCATION': MEMCACHED_LOCATION.split(','),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'mysite.caches.LocMemCache',
+        }
+    }
+
+SESSION_ENGINE = 'mysite.sessions'
+# Also keep sessions in the database, so they survive cache restarts and evictions.
+# Required when the cache is not shared between processes.
+SESSION_DB_WRITE_THROUGH = cfg('SESSION_DB_WRITE_THROUGH', default=True, cast=bool)
+
+# Token buckets in the cache, per session or client IP, see web.ratelimit
+# scope: (requests per minute, burst)
+RATELIMIT_ENABLED = cfg('RATELIMIT_ENABLED', default=True, cast=bool)
+RATELIMITS = {
+    'cart': (60, 20),
+    'login': (10, 5),
+    'contact': (2, 3),
+}
+
+
+# CDN in front of the catalog pages, which are tagged with surrogate keys and
+# purged by key when a product or category changes, see web.cdn. Only pages
+# rendered for clients without cookies are tagged. Purges are queued in the
+# database and sent by the send_cdn_purges command.
+CDN_SURROGATE_KEY_HEADER = 'Surrogate-Key'
+CDN_MAX_AGE = cfg('CDN_MAX_AGE', default=0, cast=int)
+CDN_PURGE_BACKEND = cfg('CDN_PURGE_BACKEND', default='web.cdn.LocalPurgeBackend')
+CDN_SERVICE_ID = cfg('CDN_SERVICE_ID', default='')
+CDN_API_TOKEN = cfg('CDN_API_TOKEN', default='')
+
+
+# Prometheus metrics at /metrics, scraped with METRICS_TOKEN as bearer token.
+# Without a token the endpoint is only served with DEBUG on.
+METRICS_TOKEN = cfg('METRICS_TOKEN', default='')
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -150,9 +201,60 @@ AWS_S3_OBJECT_PARAMETERS = {
 }
 AWS_LOCATION = 'static'
 
-STATIC_URL = 'https://%s/%s/' % (AWS_S3_CUSTOM_DOMAIN, AWS_LOCATION)
-STATICFILES_STORAGE = 'storages.backends.s3boto3.S3Boto3Storage'
-DEFAULT_FILE_STORAGE = 'mysite.storages.MediaStore'
+# Static files are hashed, bundled and compressed on collectstatic. They are
+# served either from the bucket or by WhiteNoise from STATIC_ROOT.
+STATIC_ON_S3 = cfg('STATIC_ON_S3', default=True, cast=bool)
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+if STATIC_ON_S3:
+    STATIC_URL = 'https://%s/%s/' % (AWS_S3_CUSTOM_DOMAIN, AWS_LOCATION)
+    STATICFILES_STORAGE = 'mysite.storages.S3StaticStore'
+else:
+    STATIC_URL = '/static/'
+    STATICFILES_STORAGE = 'mysite.storages.StaticStore'
+
+# Media files are uploaded by the browser straight to the bucket, or to the
+# local disk through the same flow when MEDIA_ON_S3 is off, see web.uploads
+MEDIA_ON_S3 = cfg('MEDIA_ON_S3', default=True, cast=bool)
+if MEDIA_ON_S3:
+    DEFAULT_FILE_STORAGE = 'mysite.storages.MediaStore'
+else:
+    DEFAULT_FILE_STORAGE = 'mysite.storages.LocalMediaStore'
+    MEDIA_URL = '/media/'
+    MEDIA_ROOT = BASE_DIR / 'media'
+IMAGE_UPLOAD_MAX_SIZE = 10 * 1024 * 1024
+
+# Bundle name: source files, in the order they are included on the page.
+# With DEBUG on, the {% bundle %} tag renders the source files one by one.
+STATIC_BUNDLES = {
+    'css/site.css': [
+        'css/icofont.min.css',
+        'css/fontello.css',
+        'css/font-vandella.css',
+        'css/animate.css',
+        'css/aos.css',
+        'css/jquery.fancybox.min.css',
+        'css/slicknav.css',
+        'css/swiper.min.css',
+        'css/style.css',
+    ],
+    'js/site.js': [
+        'js/modernizr.js',
+        'js/jquery-3.6.0.min.js',
+        'js/jquery-migrate.js',
+        'js/popper.min.js',
+        'js/bootstrap.min.js',
+        'js/jquery.appear.js',
+        'js/swiper.min.js',
+        'js/slick.min.js',
+        'js/fancybox.min.js',
+        'js/aos.min.js',
+        'js/jquery.slicknav.js',
+        'js/jquery.countdown.min.js',
+        'js/wow.min.js',
+        'js/jquery-zoom.min.js',
+        'js/custom.js',
+    ],
+}
 
 
 # Default primary key field type
@@ -1,6 +1,112 @@
-from storages.backends.s3boto3 import S3Boto3Storage
+import re
+import time
 
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import PermissionDenied
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.urls import reverse
+from django.utils.module_loading import import_string
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+
+# hashed names look like 'css/site.3f1a2b4c5d6e.css'
+HASHED_NAME_RE = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+# media deduplicated by dedup_media are named after their content, 'img/<sha256>.jpg'
+CONTENT_NAME_RE = re.compile(r'(^|/)[0-9a-f]{64}\.[^./]+$')
+
+# extension: (minifier, separator between concatenated files)
+# minifiers are only imported by collectstatic
+MINIFIERS = {
+    '.css': ('rcssmin.cssmin', '\n'),
+    # ';' keeps scripts without a trailing semicolon apart
+    '.js': ('rjsmin.jsmin', ';\n'),
+}
+
+# The S3 backends live in mysite.s3_storages, so boto3 is only imported
+# once a setting using them is first accessed.
+S3_STORAGES = ('MediaStore', 'S3StaticStore')
+
+
+def __getattr__(name):
+    if name in S3_STORAGES:
+        from . import s3_storages
+        return getattr(s3_storages, name)
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+
+
+# MEDIA FILES
+class LocalMediaStore(FileSystemStorage):
+    """
+    Media on the local disk with the direct upload interface of MediaStore,
+    so the admin upload flow works offline. Uploads are posted to the
+    local_upload view with a signed policy instead of a presigned S3 form.
+    """
+    salt = 'mysite.storages.LocalMediaStore'
+
+    def presigned_upload(self, name, content_type, max_size, expires=3600):
+        policy = signing.dumps({'key': name, 'max_size': max_size, 'expires_at': time.time() + expires}, salt=self.salt)
+        return {
+            'url': reverse('local_upload'),
+            'fields': {'key': name, 'Content-Type': content_type, 'policy': policy},
+        }
+
+    def receive_upload(self, fields, content):
+        try:
+            policy = signing.loads(fields.get('policy', ''), salt=self.salt)
+        except signing.BadSignature:
+            raise PermissionDenied('Invalid upload policy')
+        if policy['key'] != fields.get('key') or policy['expires_at'] < time.time():
+            raise PermissionDenied('Upload policy does not match or has expired')
+        if content is None or not 0 < content.size <= policy['max_size']:
+            raise PermissionDenied('Upload size is not allowed')
+        if self.exists(policy['key']):
+            self.delete(policy['key'])
+        return self.save(policy['key'], content)
+
+    def read_header(self, name, size):
+        with self.open(name) as f:
+            return f.read(size)
+
+
+# STATIC FILES
+class BundleMixin:
+    """
+    Concatenates and minifies every STATIC_BUNDLES entry during collectstatic.
+    Bundles are added to the collected paths before hashing, so they get
+    content-hashed names and compressed copies like any other static file.
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        if not dry_run:
+            for name in self.build_bundles(paths):
+                paths[name] = (self, name)
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+
+    def build_bundles(self, paths):
+        for name, sources in settings.STATIC_BUNDLES.items():
+            minifier, separator = MINIFIERS[name[name.rfind('.'):]]
+            minify = import_string(minifier)
+            parts = []
+            for source in sources:
+                storage, path = paths[source]
+                with storage.open(path) as f:
+                    parts.append(minify(f.read().decode('utf-8')))
+            if self.exists(name):
+                self.delete(name)
+            self.save(name, ContentFile(separator.join(parts).encode('utf-8')))
+            yield name
+
+    def hashed_name(self, name, content=None, filename=None):
+        # Vendor CSS references fonts that are not shipped with the project,
+        # keep such urls as they are instead of failing the whole collectstatic.
+        try:
+            return super().hashed_name(name, content, filename)
+        except ValueError:
+            return name
+
+
+class StaticStore(BundleMixin, CompressedManifestStaticFilesStorage):
+    """Local static files served by WhiteNoise with gzip and brotli copies."""
 
-class MediaStore(S3Boto3Storage):
-    location = 'media'
-    file_overwrite = False
@@ -1,6 +1,131 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
+from django.db.models import F
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
+from django.urls import path, reverse_lazy
+from django.utils import timezone
 
 from .models import *
+from .exports import CONTENT_TYPES, FORMAT_CSV, export_orders
+from .forms import OrderExportForm
+from .inventory import adjust
+from .orders import STATUS_NAMES, transition
+from .pricing import update_prices
+from .uploads import DirectUploadField, presign_view
+
+
+class OrderStatusChangeInline(admin.TabularInline):
+    model = OrderStatusChange
+    fields = readonly_fields = ('old_status', 'new_status', 'changed_by', 'changed_at')
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+def transition_action(status):
+    def action(modeladmin, request, queryset):
+        moved = transition(queryset, status, user=request.user)
+        skipped = queryset.count() - moved
+        modeladmin.message_user(request, '{} orders moved to "{}"{}'.format(
+            moved, STATUS_NAMES[status], ', {} skipped'.format(skipped) if skipped else ''),
+            messages.WARNING if skipped else messages.SUCCESS)
+
+    action.__name__ = 'mark_{}'.format(status)
+    action.short_description = 'Mark selected orders as "{}"'.format(STATUS_NAMES[status])
+    return action
+
+
+class OrderAdmin(admin.ModelAdmin):
+    change_list_template = 'admin/web/order/change_list.html'
+    list_display = ('id', 'customer', 'status', 'buying_type', 'order_date', 'created_at')
+    list_filter = ('status', 'buying_type', 'order_date')
+    # statuses only change through the workflow actions, so every change is validated and recorded
+    readonly_fields = ('status',)
+    inlines = [OrderStatusChangeInline]
+    actions = [transition_action(status) for status, _ in Order.STATUS_CHOICES if status != Order.STATUS_NEW]
+
+    def get_urls(self):
+        urls = [
+            path('export/', self.admin_site.admin_view(self.export_view), name='web_order_export'),
+        ]
+        return urls + super().get_urls()
+
+    # Streams orders with their lines, filtered by ?date_from=&date_to=&status=&format=csv|jsonl
+    def export_view(self, request):
+        # admin_view only checks is_staff, the export holds every customer's address
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        form = OrderExportForm(request.GET)
+        if not form.is_valid():
+            return HttpResponseBadRequest(form.errors.as_text(), content_type='text/plain')
+        export_format = form.cleaned_data['format'] or FORMAT_CSV
+        lines = export_orders(
+            export_format,
+            date_from=form.cleaned_data['date_from'],
+            date_to=form.cleaned_data['date_to'],
+            status=form.cleaned_data['status'],
+        )
+        response = StreamingHttpResponse(lines, content_type=CONTENT_TYPES[export_format])
+        response['Content-Disposition'] = 'attachment; filename="orders-{}.{}"'.format(
+            timezone.now().strftime('%Y%m%d-%H%M%S'), export_format)
+        return response
+
+
+class ProductAdminForm(forms.ModelForm):
+    # the browser uploads the images to the storage, only their names are posted
+    thumbnail_image = DirectUploadField(reverse_lazy('admin:web_product_upload'), help_text='360 x 480 px')
+    big_image = DirectUploadField(reverse_lazy('admin:web_product_upload'), help_text='600 x 800 px')
+
+    class Meta:
+        model = Product
+        fields = '__all__'
+
+
+def sale_action(percent):
+    def action(modeladmin, request, queryset):
+        # products already on sale keep their sale price
+        updated = update_prices(
+            queryset.filter(old_price__lte=F('price')),
+            {'old_price': F('price')},
+            {'price': F('old_price') * (100 - percent) / 100},
+        )
+        modeladmin.message_user(request, '{} products put on sale, {}% off'.format(updated, percent))
+
+    action.__name__ = 'sale_{}'.format(percent)
+    action.short_description = 'Put selected products on sale, {}% off'.format(percent)
+    return action
+
+
+def end_sale(modeladmin, request, queryset):
+    updated = update_prices(queryset.filter(old_price__gt=F('price')), {'price': F('old_price')}, {'old_price': 0})
+    modeladmin.message_user(request, '{} products back to their regular price'.format(updated))
+
+
+end_sale.short_description = 'End the sale of selected products'
+
+
+class ProductAdmin(admin.ModelAdmin):
+    form = ProductAdminForm
+    list_display = ('title', 'category', 'price', 'old_price', 'availability')
+    list_filter = ('category',)
+    # price changes queue the open carts for the reprice_carts command, see web.pricing.update_prices
+    actions = [sale_action(10), sale_action(20), sale_action(30), end_sale]
+
+    def save_model(self, request, obj, form, change):
+        if change and 'availability' in form.changed_data:
+            # the stock shards hold the stock, fold() would overwrite a plain edit
+            adjust(obj.pk, obj.availability)
+        super().save_model(request, obj, form, change)
+
+    def get_urls(self):
+        urls = [
+            path('upload/', self.admin_site.admin_view(presign_view), name='web_product_upload'),
+        ]
+        return urls + super().get_urls()
+
 
 # Register your models here.
 
@@ -8,5 +133,7 @@ admin.site.register(Category)
 admin.site.register(Customer)
 admin.site.register(Cart)
 admin.site.register(CartProduct)
-admin.site.register(Order)
-admin.site.register(Product)
\ No newline at end of file
+admin.site.register(Order, OrderAdmin)
+admin.site.register(Product, ProductAdmin)
+admin.site.register(ShippingRule)
+admin.site.register(Promotion)
\ No newline at end of file
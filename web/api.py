@@ -0,0 +1,184 @@
+import hashlib
+import json
+
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, JsonResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import urlencode
+from django.views.decorators.http import require_GET
+
+from .models import Category, Product
+
+
+API_VERSION = 1
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+MAX_AGE = 60
+
+# field name: column read for it
+PRODUCT_FIELDS = {
+    'id': 'id',
+    'slug': 'slug',
+    'title': 'title',
+    'description': 'description',
+    'detailed_description': 'detailed_description',
+    'price': 'price',
+    'old_price': 'old_price',
+    'availability': 'availability',
+    'category': 'category__slug',
+    'thumbnail_image': 'thumbnail_image',
+    'big_image': 'big_image',
+    'updated_at': 'updated_at',
+    'url': 'slug',
+}
+DEFAULT_PRODUCT_FIELDS = (
+    'id', 'slug', 'title', 'price', 'old_price', 'availability', 'category', 'thumbnail_image', 'url',
+)
+IMAGE_FIELDS = ('thumbnail_image', 'big_image')
+# the columns an ETag is computed from: availability is folded from the stock
+# movements by an update that leaves updated_at alone
+VERSION_COLUMNS = ('id', 'updated_at', 'category__updated_at', 'availability')
+
+
+class BadRequest(Exception):
+    pass
+
+
+def parse_fields(request, allowed, default):
+    """Fields asked for with ?fields=a,b,c, in the given order."""
+    if 'fields' not in request.GET:
+        return list(default)
+    fields = [field.strip() for field in request.GET['fields'].split(',') if field.strip()]
+    unknown = [field for field in fields if field not in allowed]
+    if unknown or not fields:
+        raise BadRequest('Unknown fields: {}. Available: {}'.format(', '.join(unknown), ', '.join(allowed)))
+    return list(dict.fromkeys(fields))
+
+
+def parse_int(request, name, default, maximum=None):
+    try:
+        value = int(request.GET.get(name, default))
+    except ValueError:
+        raise BadRequest('{} must be a number'.format(name))
+    if value < 0:
+        raise BadRequest('{} must not be negative'.format(name))
+    return min(value, maximum) if maximum else value
+
+
+def make_etag(*parts):
+    # strong: the same versions and parameters always give the same body
+    digest = hashlib.sha1(json.dumps([API_VERSION, *parts], cls=DjangoJSONEncoder).encode('utf-8')).hexdigest()
+    return '"{}"'.format(digest)
+
+
+def respond(request, etag, build):
+    """304 when the client has this version, else the JSON built by build()."""
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = JsonResponse(build())
+    response['ETag'] = etag
+    patch_cache_control(response, public=True, max_age=MAX_AGE)
+    return response
+
+
+def error(message, status=400):
+    return JsonResponse({'error': message}, status=status)
+
+
+def product_data(row, fields):
+    data = {}
+    for field in fields:
+        value = row[PRODUCT_FIELDS[field]]
+        if field in IMAGE_FIELDS:
+            value = default_storage.url(value) if value else None
+        elif field == 'url':
+            value = reverse('product_detail', kwargs={'slug': value})
+        data[field] = value
+    return data
+
+
+def product_columns(fields):
+    return list(dict.fromkeys(list(VERSION_COLUMNS) + [PRODUCT_FIELDS[field] for field in fields]))
+
+
+def product_version(row):
+    return [row[column] for column in VERSION_COLUMNS]
+
+
+# api/categories
+@require_GET
+def categories(request):
+    rows = list(
+        Category.objects.order_by('id').values(
+            'id', 'slug', 'name', 'updated_at', 'stats__product_count', 'stats__in_stock_count',
+            'stats__sale_count', 'stats__min_price', 'stats__max_price',
+        )
+    )
+
+    def build():
+        return {'results': [
+            {
+                'id': row['id'],
+                'slug': row['slug'],
+                'name': row['name'],
+                'url': reverse('category_detail', kwargs={'slug': row['slug']}),
+                'product_count': row['stats__product_count'] or 0,
+                'in_stock_count': row['stats__in_stock_count'] or 0,
+                'sale_count': row['stats__sale_count'] or 0,
+                'min_price': row['stats__min_price'],
+                'max_price': row['stats__max_price'],
+            }
+            for row in rows
+        ]}
+
+    return respond(request, make_etag(rows), build)
+
+
+# api/products?category=&after=&limit=&fields=
+@require_GET
+def products(request):
+    """
+    Products by id, one page at a time: ?after= is the last id of the previous
+    page, the response links to the next one. The ETag is computed from the
+    ids and versions of the page, read by the same query as the page itself.
+    """
+    try:
+        fields = parse_fields(request, PRODUCT_FIELDS, DEFAULT_PRODUCT_FIELDS)
+        after = parse_int(request, 'after', 0)
+        limit = parse_int(request, 'limit', PAGE_SIZE, MAX_PAGE_SIZE) or PAGE_SIZE
+    except BadRequest as e:
+        return error(str(e))
+    queryset = Product.objects.filter(id__gt=after).order_by('id')
+    category = request.GET.get('category')
+    if category:
+        queryset = queryset.filter(category__slug=category)
+    # one more row tells whether there is a next page
+    rows = list(queryset.values(*product_columns(fields))[:limit + 1])
+    has_next = len(rows) > limit
+    rows = rows[:limit]
+
+    def build():
+        data = {'results': [product_data(row, fields) for row in rows], 'next': None}
+        if has_next:
+            params = {key: value for key, value in request.GET.items() if key != 'after'}
+            params['after'] = rows[-1]['id']
+            data['next'] = '{}?{}'.format(reverse('api_products'), urlencode(params))
+        return data
+
+    versions = [product_version(row) for row in rows]
+    return respond(request, make_etag(versions, fields, category, limit, has_next), build)
+
+
+# api/products/<slug>?fields=
+@require_GET
+def product(request, slug):
+    try:
+        fields = parse_fields(request, PRODUCT_FIELDS, PRODUCT_FIELDS)
+    except BadRequest as e:
+        return error(str(e))
+    row = Product.objects.filter(slug=slug).values(*product_columns(fields)).first()
+    if row is None:
+        raise Http404
+    return respond(request, make_etag(product_version(row), fields), lambda: product_data(row, fields))
@@ -0,0 +1,110 @@
+from collections import namedtuple
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, Max, Min, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Cast, Coalesce, Greatest, Least
+
+from .models import Category, CategoryStats, Product
+
+
+# the product fields the stats depend on, in the order of a product state
+STATE_FIELDS = ('category_id', 'price', 'old_price', 'availability')
+REBUILD_BATCH_SIZE = 1000
+
+
+ProductState = namedtuple('ProductState', STATE_FIELDS)
+
+
+def product_state(product):
+    """ProductState of an unsaved or saved product."""
+    return ProductState(
+        product.category_id,
+        Product._meta.get_field('price').to_python(product.price),
+        Product._meta.get_field('old_price').to_python(product.old_price),
+        product.availability,
+    )
+
+
+def saved_state(product_id):
+    """ProductState of the product as stored, None when it is not."""
+    row = Product.objects.filter(id=product_id).values_list(*STATE_FIELDS).first()
+    return row and ProductState(*row)
+
+
+def _price(value):
+    # some drivers pass decimals as strings, compare them as numbers
+    return Cast(Value(value), DecimalField(decimal_places=2, max_digits=8))
+
+
+def _add(state):
+    category_id, price, old_price, availability = state
+    updated = CategoryStats.objects.filter(category_id=category_id).update(
+        product_count=F('product_count') + 1,
+        in_stock_count=F('in_stock_count') + int(availability > 0),
+        sale_count=F('sale_count') + int(old_price > price),
+        # both bounds are NULL while the category is empty
+        min_price=Least(Coalesce('min_price', _price(price)), _price(price)),
+        max_price=Greatest(Coalesce('max_price', _price(price)), _price(price)),
+    )
+    if not updated:
+        # first product of the category since the last rebuild, the product is already counted
+        rebuild([category_id])
+
+
+def _remove(state):
+    category_id, price, old_price, availability = state
+    stats = CategoryStats.objects.filter(category_id=category_id)
+    stats.update(
+        product_count=F('product_count') - 1,
+        in_stock_count=F('in_stock_count') - int(availability > 0),
+        sale_count=F('sale_count') - int(old_price > price),
+    )
+    # the bounds only move when the product held one of them
+    prices = Product.objects.filter(category_id=OuterRef('category_id')).order_by().values('category_id')
+    stats.filter(Q(min_price__gte=price) | Q(max_price__lte=price)).update(
+        min_price=Subquery(prices.annotate(value=Min('price')).values('value')),
+        max_price=Subquery(prices.annotate(value=Max('price')).values('value')),
+    )
+
+
+def product_changed(before, after):
+    """
+    Move a product from its previous state to its new one in the stats,
+    before is None for a new product and after is None for a deleted one.
+    Called once the product row is written, in the same transaction.
+    """
+    if before == after:
+        return
+    with transaction.atomic():
+        if before is not None:
+            _remove(before)
+        if after is not None:
+            _add(after)
+
+
+def _figures(category_ids):
+    rows = Product.objects.filter(category_id__in=category_ids).order_by().values('category_id').annotate(
+        product_count=Count('id'),
+        in_stock_count=Count('id', filter=Q(availability__gt=0)),
+        sale_count=Count('id', filter=Q(old_price__gt=F('price'))),
+        min_price=Min('price'),
+        max_price=Max('price'),
+    )
+    return {row.pop('category_id'): row for row in rows}
+
+
+def rebuild(category_ids=None, batch_size=REBUILD_BATCH_SIZE):
+    """Recount the stats of the given categories, or of all of them, returns the number of categories."""
+    categories = Category.objects.order_by('id')
+    if category_ids is not None:
+        categories = categories.filter(id__in=category_ids)
+    category_ids = list(categories.values_list('id', flat=True))
+    for start in range(0, len(category_ids), batch_size):
+        batch = category_ids[start:start + batch_size]
+        figures = _figures(batch)
+        with transaction.atomic():
+            CategoryStats.objects.filter(category_id__in=batch).delete()
+            CategoryStats.objects.bulk_create(
+                [CategoryStats(category_id=category_id, **figures.get(category_id, {})) for category_id in batch]
+            )
+    return len(category_ids)
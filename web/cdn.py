@@ -0,0 +1,138 @@
+import json
+import logging
+import urllib.request
+from collections import deque
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.module_loading import import_string
+
+from .models import CdnPurge
+
+
+logger = logging.getLogger(__name__)
+
+# Pages listing the whole catalog, or the category menu with its product counts
+PRODUCTS_KEY = 'products'
+CATEGORIES_KEY = 'categories'
+# The CDN takes this many keys per purge request
+PURGE_BATCH_SIZE = 256
+SEND_BATCH_SIZE = 1000
+
+
+def product_key(product_id):
+    return 'product-{}'.format(product_id)
+
+
+def category_key(category_id):
+    return 'category-{}'.format(category_id)
+
+
+def tag(response, *keys):
+    """
+    Mark a response with surrogate keys, the CDN purges it when one of them is
+    purged. SurrogateKeyMiddleware only sends them when the page can be shared.
+    """
+    known = getattr(response, 'surrogate_keys', [])
+    response.surrogate_keys = list(dict.fromkeys(known + [str(key) for key in keys]))
+    return response
+
+
+def shareable(request, response):
+    """
+    A page can be cached for everyone when it was rendered for a client without
+    cookies and sets none: then it has no session, no cart, no CSRF token.
+    """
+    return (request.method in ('GET', 'HEAD') and response.status_code == 200 and
+            not request.COOKIES and not response.cookies)
+
+
+class SurrogateKeyMiddleware:
+    """Sends the surrogate keys of shareable pages, it goes above the session and CSRF middleware."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        keys = getattr(response, 'surrogate_keys', None)
+        if keys and shareable(request, response):
+            response[settings.CDN_SURROGATE_KEY_HEADER] = ' '.join(keys)
+            # clients with cookies, e.g. signed in, never get the shared copy
+            patch_vary_headers(response, ('Cookie',))
+            if settings.CDN_MAX_AGE:
+                # how long the CDN keeps the page, browsers still go by Cache-Control
+                response['Surrogate-Control'] = 'max-age={}'.format(settings.CDN_MAX_AGE)
+        return response
+
+
+class PurgeBackend:
+    """Purges the cached responses tagged with any of the given surrogate keys."""
+
+    def purge(self, keys):
+        raise NotImplementedError
+
+
+class LocalPurgeBackend(PurgeBackend):
+    """Only records the purges, for development and tests."""
+    purged = deque(maxlen=1000)
+
+    def purge(self, keys):
+        self.purged.append(sorted(keys))
+
+
+class FastlyPurgeBackend(PurgeBackend):
+    """Soft purge by surrogate key through the Fastly API."""
+    url = 'https://api.fastly.com/service/{}/purge'
+
+    def purge(self, keys):
+        keys = sorted(keys)
+        for start in range(0, len(keys), PURGE_BATCH_SIZE):
+            request = urllib.request.Request(
+                self.url.format(settings.CDN_SERVICE_ID),
+                data=json.dumps({'surrogate_keys': keys[start:start + PURGE_BATCH_SIZE]}).encode('utf-8'),
+                headers={
+                    'Fastly-Key': settings.CDN_API_TOKEN,
+                    'Fastly-Soft-Purge': '1',
+                    'Content-Type': 'application/json',
+                    'Accept': 'application/json',
+                },
+                method='POST',
+            )
+            urllib.request.urlopen(request, timeout=5).close()
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = import_string(settings.CDN_PURGE_BACKEND)()
+    return _backend
+
+
+def purge(*keys):
+    """
+    Queue the keys for send_purges(), in the current transaction: nothing is
+    purged on rollback, and saves never wait for the CDN.
+    """
+    CdnPurge.objects.bulk_create([CdnPurge(key=key) for key in set(keys)])
+
+
+def send_purges(batch_size=SEND_BATCH_SIZE):
+    """Purge the queued keys through CDN_PURGE_BACKEND, returns the number of distinct keys."""
+    purged = 0
+    while True:
+        batch = list(CdnPurge.objects.order_by('id').values_list('id', 'key')[:batch_size])
+        if not batch:
+            return purged
+        keys = {key for _, key in batch}
+        try:
+            get_backend().purge(keys)
+        except Exception:
+            # the keys stay queued for the next run, the pages expire on their own meanwhile
+            logger.exception('CDN purge of %s failed', ' '.join(sorted(keys)))
+            return purged
+        CdnPurge.objects.filter(id__in=[purge_id for purge_id, _ in batch]).delete()
+        purged += len(keys)
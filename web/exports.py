@@ -0,0 +1,94 @@
+import csv
+import json
+from itertools import groupby
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Order
+
+
+EXPORT_BATCH_SIZE = 1000
+
+ORDER_FIELDS = (
+    'id', 'created_at', 'order_date', 'status', 'buying_type', 'customer_id',
+    'first_name', 'last_name', 'phone_number', 'address', 'cart_id', 'cart__final_price',
+)
+LINE_FIELDS = (
+    'cart__related_products__product__slug',
+    'cart__related_products__product__title',
+    'cart__related_products__quantity',
+    'cart__related_products__final_price',
+)
+ORDER_COLUMNS = (
+    'order_id', 'created_at', 'order_date', 'status', 'buying_type', 'customer_id',
+    'first_name', 'last_name', 'phone_number', 'address', 'cart_id', 'order_total',
+)
+LINE_COLUMNS = ('product_slug', 'product_title', 'quantity', 'line_total')
+
+FORMAT_CSV = 'csv'
+FORMAT_JSONL = 'jsonl'
+CONTENT_TYPES = {
+    FORMAT_CSV: 'text/csv',
+    FORMAT_JSONL: 'application/x-ndjson',
+}
+
+
+def filter_orders(date_from=None, date_to=None, status=None):
+    orders = Order.objects.all()
+    # created_at changes on every save of the order, order_date is the date it was placed for
+    if date_from:
+        orders = orders.filter(order_date__gte=date_from)
+    if date_to:
+        orders = orders.filter(order_date__lte=date_to)
+    if status:
+        orders = orders.filter(status=status)
+    return orders
+
+
+def order_rows(orders, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Yield one tuple per order line (order fields + line fields), ordered by order id.
+    Orders are read in keyset batches joined with their lines, so memory use
+    does not depend on the number of exported orders, whatever the database driver.
+    """
+    last_id = 0
+    while True:
+        ids = list(orders.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return
+        last_id = ids[-1]
+        yield from Order.objects.filter(id__in=ids).order_by('id', 'cart__related_products__id').values_list(
+            *ORDER_FIELDS, *LINE_FIELDS
+        )
+
+
+class Echo:
+    """csv.writer target returning the line instead of buffering it."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(ORDER_COLUMNS + LINE_COLUMNS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def jsonl_lines(rows):
+    # rows of one order are consecutive, they become one object with its lines
+    order_size = len(ORDER_FIELDS)
+    for order, lines in groupby(rows, key=lambda row: row[:order_size]):
+        data = dict(zip(ORDER_COLUMNS, order))
+        data['lines'] = [
+            dict(zip(LINE_COLUMNS, line[order_size:])) for line in lines if line[order_size] is not None
+        ]
+        yield json.dumps(data, cls=DjangoJSONEncoder) + '\n'
+
+
+def export_orders(export_format, **filters):
+    rows = order_rows(filter_orders(**filters))
+    if export_format == FORMAT_JSONL:
+        return jsonl_lines(rows)
+    return csv_lines(rows)
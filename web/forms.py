@@ -1,6 +1,7 @@
 from django import forms
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import AuthenticationForm
+from .exports import FORMAT_CSV, FORMAT_JSONL
 from .models import Order
 
 
@@ -23,6 +24,21 @@ class OrderForm(forms.ModelForm):
         )
 
 
+# Filters of the admin order export, see web.exports
+class OrderExportForm(forms.Form):
+    date_from = forms.DateField(required=False)
+    date_to = forms.DateField(required=False)
+    status = forms.ChoiceField(choices=(('', 'All statuses'),) + Order.STATUS_CHOICES, required=False)
+    format = forms.ChoiceField(choices=((FORMAT_CSV, 'CSV'), (FORMAT_JSONL, 'JSON lines')), required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        date_from, date_to = cleaned_data.get('date_from'), cleaned_data.get('date_to')
+        if date_from and date_to and date_from > date_to:
+            raise forms.ValidationError('date_from is after date_to')
+        return cleaned_data
+
+
 # Login form
 class LoginForm(forms.ModelForm):
 
@@ -36,18 +52,28 @@ class LoginForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
         self.fields['username'].label = 'Username'
         self.fields['password'].label = 'Password'
+        self.user = None
 
+    # The password is hashed once here, the view logs in form.get_user()
+    # instead of calling authenticate() and hashing it again.
     def clean(self):
         username = self.cleaned_data['username']
         password = self.cleaned_data['password']
-        if not User.objects.filter(username=username).exists():
-            raise forms.ValidationError(f"User with login {username} does not exist!")
         user = User.objects.filter(username=username).first()
-        if user:
-            if not user.check_password(password):
-                raise forms.ValidationError('Wrong password!')
+        if not user or not user.is_active:
+            raise forms.ValidationError(f"User with login {username} does not exist!")
+        if not user.check_password(password):
+            raise forms.ValidationError('Wrong password!')
+        self.user = user
         return self.cleaned_data
 
+    def validate_unique(self):
+        # the user is expected to exist, no need for a uniqueness query
+        pass
+
+    def get_user(self):
+        return self.user
+
 
 # Registration form
 class RegistrationForm(forms.ModelForm):
@@ -0,0 +1,145 @@
+import random
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, OuterRef, Q, Subquery, Sum
+from django.utils import timezone
+
+from . import category_stats, cdn
+from .models import InventoryCheckpoint, Product, StockMovement, StockShard
+
+
+SHARDS = 8
+FOLD_BATCH_SIZE = 1000
+# the checkpoint stays this far behind, see fold()
+FOLD_MARGIN = timedelta(minutes=5)
+
+
+class OutOfStock(Exception):
+
+    def __init__(self, product_id, quantity):
+        super().__init__('Not enough stock of product {} for {} items'.format(product_id, quantity))
+        self.product_id = product_id
+        self.quantity = quantity
+
+
+def ensure_shards(product_id, shards=SHARDS):
+    """Split the product's availability over its shards the first time stock moves."""
+    if StockShard.objects.filter(product_id=product_id).exists():
+        return
+    availability = Product.objects.values_list('availability', flat=True).get(id=product_id)
+    StockShard.objects.bulk_create(
+        [
+            StockShard(product_id=product_id, shard=shard, available=availability // shards + (shard < availability % shards))
+            for shard in range(shards)
+        ],
+        # a concurrent first movement already created them
+        ignore_conflicts=True,
+    )
+
+
+def _take(product_id, quantity, shards):
+    # locks a single shard row holding the whole quantity, from a random shard on and wrapping around.
+    # Rows locked by another checkout are skipped, never waited for, so two checkouts of one product
+    # can not deadlock on its shards; only _take_across waits, locking them in shard order.
+    start = random.randrange(shards)
+    with transaction.atomic():
+        for part in (Q(shard__gte=start), Q(shard__lt=start)):
+            shard_id = StockShard.objects.select_for_update(skip_locked=True).filter(
+                part, product_id=product_id, available__gte=quantity,
+            ).order_by('shard').values_list('id', flat=True).first()
+            if shard_id:
+                StockShard.objects.filter(id=shard_id).update(available=F('available') - quantity)
+                return True
+    return False
+
+
+def _take_across(product_id, quantity):
+    # slow path, locks every shard of the product and takes from several of them
+    with transaction.atomic():
+        shards = list(StockShard.objects.select_for_update().filter(product_id=product_id).order_by('shard'))
+        if sum(shard.available for shard in shards) < quantity:
+            return False
+        remaining = quantity
+        for shard in shards:
+            used = min(shard.available, remaining)
+            shard.available -= used
+            remaining -= used
+        StockShard.objects.bulk_update(shards, ['available'])
+    return True
+
+
+def take(product_id, quantity, kind=StockMovement.KIND_SALE, order=None, shards=SHARDS):
+    """Remove stock for a sale or reservation, raises OutOfStock when there is not enough."""
+    ensure_shards(product_id, shards)
+    # the stock may be there, just spread over several shards
+    if not _take(product_id, quantity, shards) and not _take_across(product_id, quantity):
+        raise OutOfStock(product_id, quantity)
+    StockMovement.objects.create(product_id=product_id, kind=kind, quantity=-quantity, order=order)
+
+
+def put(product_id, quantity, kind=StockMovement.KIND_RECEIPT, order=None, shards=SHARDS):
+    """Add stock for a receipt, a return or a released reservation."""
+    ensure_shards(product_id, shards)
+    StockShard.objects.filter(
+        product_id=product_id, shard=random.randrange(shards)
+    ).update(available=F('available') + quantity)
+    StockMovement.objects.create(product_id=product_id, kind=kind, quantity=quantity, order=order)
+
+
+def adjust(product_id, availability, shards=SHARDS):
+    """
+    Set the available stock to a counted figure, e.g. entered in the admin,
+    and record the difference as an adjustment. Returns the difference.
+    """
+    ensure_shards(product_id, shards)
+    with transaction.atomic():
+        rows = list(StockShard.objects.select_for_update().filter(product_id=product_id).order_by('shard'))
+        difference = availability - sum(row.available for row in rows)
+        if not difference:
+            return 0
+        for position, row in enumerate(rows):
+            row.available = availability // len(rows) + (position < availability % len(rows))
+        StockShard.objects.bulk_update(rows, ['available'])
+        StockMovement.objects.create(product_id=product_id, kind=StockMovement.KIND_ADJUSTMENT, quantity=difference)
+    return difference
+
+
+def fold(batch_size=FOLD_BATCH_SIZE):
+    """
+    Write the shard totals of every product with new ledger rows back into
+    Product.availability, in batches of products. Returns the number of products.
+    Movement ids are taken when a row is inserted, not when it commits, so a
+    transaction still open now may commit a lower id than the highest one
+    seen. The checkpoint only moves up to the movements older than
+    FOLD_MARGIN; the products of newer ones are folded again on the next run.
+    """
+    checkpoint, _ = InventoryCheckpoint.objects.get_or_create(id=1)
+    product_ids = list(
+        StockMovement.objects.filter(id__gt=checkpoint.last_movement_id)
+        .order_by().values_list('product_id', flat=True).distinct()
+    )
+    if not product_ids:
+        return 0
+    settled_id = StockMovement.objects.filter(
+        id__gt=checkpoint.last_movement_id, created_at__lte=timezone.now() - FOLD_MARGIN,
+    ).order_by('-id').values_list('id', flat=True).first()
+    totals = StockShard.objects.filter(product_id=OuterRef('id')).order_by().values('product_id').annotate(
+        total=Sum('available')
+    ).values('total')
+    category_ids = set()
+    for start in range(0, len(product_ids), batch_size):
+        batch = product_ids[start:start + batch_size]
+        products = Product.objects.filter(id__in=batch)
+        with transaction.atomic():
+            products.update(availability=Subquery(totals))
+            # the product pages show the stock left
+            cdn.purge(*[cdn.product_key(product_id) for product_id in batch])
+        category_ids.update(products.order_by().values_list('category_id', flat=True).distinct())
+    # a queryset update sends no signals, recount the in-stock figures of the touched categories
+    category_stats.rebuild(category_ids)
+    cdn.purge(cdn.PRODUCTS_KEY, cdn.CATEGORIES_KEY, *[cdn.category_key(category_id) for category_id in category_ids])
+    if settled_id:
+        checkpoint.last_movement_id = settled_id
+        checkpoint.save()
+    return len(product_ids)
@@ -0,0 +1,54 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from web.inventory import SHARDS, OutOfStock, take
+from web.models import Category, Product
+
+
+class Command(BaseCommand):
+    help = 'Measures concurrent purchases of one product with a single stock row and with sharded stock'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--purchases', type=int, default=200, help='Purchases per thread')
+        parser.add_argument('--shards', type=int, default=SHARDS)
+
+    def handle(self, *args, **options):
+        for shards in (1, options['shards']):
+            rate = self.run(shards, options['threads'], options['purchases'])
+            self.stdout.write('{} shard(s): {:.0f} purchases/s'.format(shards, rate))
+
+    def run(self, shards, threads, purchases):
+        category = Category.objects.create(name='Inventory benchmark', slug='inventory-benchmark')
+        product = Product.objects.create(
+            title='Inventory benchmark', slug='inventory-benchmark', description='-',
+            availability=threads * purchases, category=category,
+            thumbnail_image='img/benchmark.jpg', big_image='img/benchmark.jpg',
+        )
+        errors = []
+
+        def buy():
+            try:
+                for _ in range(purchases):
+                    # one purchase per transaction, like a checkout
+                    with transaction.atomic():
+                        take(product.id, 1, shards=shards)
+            except OutOfStock as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=buy) for _ in range(threads)]
+        start = time.monotonic()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.monotonic() - start
+        category.delete()
+        if errors:
+            self.stderr.write('{} purchases failed, stock ran out'.format(len(errors)))
+        return threads * purchases / elapsed
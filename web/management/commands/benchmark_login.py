@@ -0,0 +1,60 @@
+import time
+
+from django.contrib.auth import authenticate, get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+from django.test.utils import override_settings
+
+from web.views import LoginView
+
+
+User = get_user_model()
+
+USERNAME = 'benchmark-login-user'
+PASSWORD = 'benchmark-password-123'
+
+
+class Command(BaseCommand):
+    help = 'Compares CPU time per login of the old double-hash flow and the current LoginView'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        # every iteration logs in from one client, the login rate limit would answer 429 after a few
+        with override_settings(RATELIMIT_ENABLED=False), transaction.atomic():
+            User.objects.create_user(USERNAME, password=PASSWORD)
+            old = self.measure(self.old_login, iterations)
+            new = self.measure(self.new_login, iterations)
+            # the benchmark user is never committed
+            transaction.set_rollback(True)
+
+        self.stdout.write('check_password + authenticate: {:.1f} ms CPU per login'.format(old * 1000))
+        self.stdout.write('LoginView.post:                {:.1f} ms CPU per login'.format(new * 1000))
+        self.stdout.write(self.style.SUCCESS('CPU time ratio: {:.2f}'.format(new / old)))
+
+    @staticmethod
+    def measure(func, iterations):
+        func()  # warm up
+        start = time.process_time()
+        for _ in range(iterations):
+            func()
+        return (time.process_time() - start) / iterations
+
+    @staticmethod
+    def old_login():
+        # what LoginForm.clean and LoginView.post used to do
+        User.objects.filter(username=USERNAME).first().check_password(PASSWORD)
+        authenticate(username=USERNAME, password=PASSWORD)
+
+    @staticmethod
+    def new_login():
+        request = RequestFactory().post('/login/', {'username': USERNAME, 'password': PASSWORD})
+        SessionMiddleware(lambda r: None).process_request(request)
+        request.user = AnonymousUser()
+        response = LoginView.as_view()(request)
+        assert response.status_code == 302, 'login failed'
@@ -0,0 +1,87 @@
+import time
+from datetime import timedelta
+from itertools import chain
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from web.models import CartProduct, RelatedProduct
+
+
+TOP_K = 8
+WRITE_BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = 'Builds the "bought together" table from the co-occurrence of products in ordered carts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=TOP_K, help='Related products kept per product')
+        parser.add_argument('--since-days', type=int,
+                            help='Only refresh products ordered in the last N days (default: all products)')
+
+    def handle(self, *args, **options):
+        # numpy and scipy are only needed by this batch job, keep them out of the web workers
+        import numpy as np
+        from scipy import sparse
+
+        start = time.monotonic()
+        lines = CartProduct.objects.filter(cart__in_order=True)
+        if options['since_days'] is not None:
+            since = timezone.now() - timedelta(days=options['since_days'])
+            changed = lines.filter(cart__order__created_at__gte=since).values('product_id')
+            # every ordered cart with a changed product is needed to recount its row exactly
+            lines = lines.filter(cart__related_products__product_id__in=changed)
+
+        pairs = np.fromiter(
+            chain.from_iterable(lines.values_list('cart_id', 'product_id').distinct().iterator()), dtype=np.int64,
+        ).reshape(-1, 2)
+        if not len(pairs):
+            self.stdout.write('No ordered carts to learn from')
+            return
+        cart_ids, cart_index = np.unique(pairs[:, 0], return_inverse=True)
+        product_ids, product_index = np.unique(pairs[:, 1], return_inverse=True)
+
+        # carts x products incidence matrix, its gram matrix counts carts per product pair
+        incidence = sparse.csr_matrix(
+            (np.ones(len(pairs), dtype=np.int32), (cart_index, product_index)),
+            shape=(len(cart_ids), len(product_ids)),
+        )
+        if options['since_days'] is None:
+            rows = np.arange(len(product_ids))
+        else:
+            rows = np.searchsorted(product_ids, np.fromiter(changed.distinct().values_list('product_id', flat=True),
+                                                            dtype=np.int64))
+        co_occurrence = (incidence[:, rows].T @ incidence).tocsr()
+
+        related = []
+        for row, product_row in enumerate(rows):
+            begin, end = co_occurrence.indptr[row], co_occurrence.indptr[row + 1]
+            columns = co_occurrence.indices[begin:end]
+            scores = co_occurrence.data[begin:end]
+            keep = (columns != product_row) & (scores > 0)
+            columns, scores = columns[keep], scores[keep]
+            if len(scores) > options['top']:
+                best = np.argpartition(-scores, options['top'])[:options['top']]
+                columns, scores = columns[best], scores[best]
+            order = np.lexsort((product_ids[columns], -scores))
+            product_id = int(product_ids[product_row])
+            related.extend(
+                RelatedProduct(product_id=product_id, related_id=int(product_ids[column]), rank=rank, score=int(score))
+                for rank, (column, score) in enumerate(zip(columns[order], scores[order]))
+            )
+
+        refreshed = product_ids[rows].tolist()
+        with transaction.atomic():
+            if options['since_days'] is None:
+                RelatedProduct.objects.all().delete()
+            else:
+                for begin in range(0, len(refreshed), WRITE_BATCH_SIZE):
+                    RelatedProduct.objects.filter(product_id__in=refreshed[begin:begin + WRITE_BATCH_SIZE]).delete()
+            RelatedProduct.objects.bulk_create(related, batch_size=WRITE_BATCH_SIZE)
+        elapsed = time.monotonic() - start
+        self.stdout.write(self.style.SUCCESS(
+            'Refreshed {} products from {} carts, {} related rows in {:.1f}s'.format(
+                len(refreshed), len(cart_ids), len(related), elapsed)
+        ))
@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from web.media import DEDUP_BATCH_SIZE, JPEG_QUALITY, dedup, delete_orphans
+
+
+MB = 1024 * 1024
+
+
+class Command(BaseCommand):
+    help = ('Stores every product image once per content, keeps the original and serves an optimized variant, '
+            'and deletes the duplicates')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help='Processes, one per CPU by default')
+        parser.add_argument('--batch-size', type=int, default=DEDUP_BATCH_SIZE, help='Products per batch')
+        parser.add_argument('--quality', type=int, default=JPEG_QUALITY, help='JPEG quality of the optimized variants')
+        parser.add_argument('--after', type=int, default=0, help='Start after this product id')
+        parser.add_argument('--delete-orphans', action='store_true',
+                            help='Also delete the files in img/ no product uses')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be written and deleted')
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+
+        def progress(last_id, totals):
+            self.stdout.write('Products up to id {}: {} images, {:.1f}MB read'.format(
+                last_id, totals['images'], totals['read'] / MB))
+
+        totals = dedup(
+            workers=options['workers'], batch_size=options['batch_size'], quality=options['quality'],
+            after=options['after'], dry_run=options['dry_run'], progress=progress,
+        )
+        seconds = time.monotonic() - start
+        saved = totals['deleted'] - totals['written']
+        self.stdout.write('{:.1f} images/s, {:.2f}MB/s read'.format(
+            totals['images'] / seconds if seconds else 0, totals['read'] / MB / seconds if seconds else 0))
+        if totals['errors']:
+            self.stderr.write('{} images could not be read, run the command again to retry them'.format(
+                totals['errors']))
+        if totals['read']:
+            self.stdout.write('Served images {:.1f}MB instead of {:.1f}MB'.format(
+                totals['served'] / MB, totals['read'] / MB))
+        if options['delete_orphans']:
+            files, size = delete_orphans(dry_run=options['dry_run'])
+            saved += size
+            self.stdout.write('Deleted {} unused files, {:.1f}MB'.format(files, size / MB))
+        if options['dry_run']:
+            self.stdout.write('Dry run, nothing was written or deleted')
+        self.stdout.write(self.style.SUCCESS(
+            'Deduplicated {} images in {:.1f}s, {:.1f}MB written, {:.1f}MB saved'.format(
+                totals['images'], time.monotonic() - start, totals['written'] / MB, saved / MB)
+        ))
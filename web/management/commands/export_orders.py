@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from web.exports import CONTENT_TYPES, FORMAT_CSV, export_orders
+from web.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Writes orders with their lines to a CSV or JSON lines file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='File to write')
+        parser.add_argument('--format', choices=list(CONTENT_TYPES), default=FORMAT_CSV)
+        parser.add_argument('--date-from', help='YYYY-MM-DD, inclusive')
+        parser.add_argument('--date-to', help='YYYY-MM-DD, inclusive')
+        parser.add_argument('--status', choices=[status for status, label in Order.STATUS_CHOICES])
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        written = 0
+        with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+            for line in export_orders(
+                options['format'],
+                date_from=options['date_from'],
+                date_to=options['date_to'],
+                status=options['status'],
+            ):
+                output.write(line)
+                written += 1
+        self.stdout.write(self.style.SUCCESS(
+            'Wrote {} lines to {} in {:.1f}s'.format(written, options['output'], time.monotonic() - start)
+        ))
@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from web.inventory import FOLD_BATCH_SIZE, fold
+
+
+class Command(BaseCommand):
+    help = 'Writes the stock of products with new stock movements back into Product.availability'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=FOLD_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        folded = fold(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            'Folded {} products in {:.1f}s'.format(folded, time.monotonic() - start)
+        ))
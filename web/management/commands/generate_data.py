@@ -0,0 +1,217 @@
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from io import BytesIO
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+
+from web import category_stats, pricing, search, sitemaps
+from web.models import Cart, CartProduct, Category, Customer, Order, Product, User
+
+
+ADJECTIVES = (
+    'Urban', 'Trail', 'Carbon', 'Classic', 'Light', 'Pro', 'Sport', 'Touring', 'Folding', 'Electric',
+    'Vintage', 'Junior', 'Racing', 'Comfort', 'Gravel', 'City', 'Mountain', 'Road', 'Steel', 'Aero',
+)
+NOUNS = (
+    'Bike', 'Helmet', 'Saddle', 'Pedals', 'Gloves', 'Lights', 'Lock', 'Pump', 'Bottle', 'Jersey',
+    'Tyre', 'Chain', 'Brakes', 'Bell', 'Rack', 'Bag', 'Mirror', 'Wheel', 'Fork', 'Handlebar',
+)
+FIRST_NAMES = ('Anna', 'Ivan', 'Maria', 'Oleg', 'Sofia', 'Petr', 'Elena', 'Denis', 'Olga', 'Artem')
+LAST_NAMES = ('Ivanov', 'Petrova', 'Smirnov', 'Volkova', 'Kuznetsov', 'Popova', 'Sokolov', 'Orlova')
+STREETS = ('Lenina', 'Mira', 'Sadovaya', 'Pushkina', 'Gagarina', 'Lesnaya', 'Shkolnaya')
+
+# every generated account logs in with it
+PASSWORD = 'loadtest'
+THUMBNAIL_SIZE = (360, 480)
+BIG_IMAGE_SIZE = (600, 800)
+# orders are dated up to a year before it, so a seed always gives the same orders
+ORDER_BASE_DATE = date(2021, 9, 1)
+
+
+class Command(BaseCommand):
+    help = 'Fills the database with a reproducible synthetic catalog, customers, carts and orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--categories', type=int, default=50)
+        parser.add_argument('--products', type=int, default=100000)
+        parser.add_argument('--users', type=int, default=10000, help='Users, each with a Customer')
+        parser.add_argument('--carts', type=int, default=100000)
+        parser.add_argument('--max-lines', type=int, default=6, help='Most lines in one cart')
+        parser.add_argument('--ordered', type=float, default=0.6, help='Share of the carts turned into orders')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if not options['users'] and options['carts']:
+            self.stderr.write('Carts need at least one user')
+            return
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.counts = {}
+        self.timings = {}
+        start = time.monotonic()
+
+        categories = self.create_categories(options['categories'])
+        products = self.create_products(options['products'], categories)
+        customers = self.create_customers(options['users'])
+        self.create_carts(options['carts'], customers, products, options['max_lines'], options['ordered'])
+
+        # bulk_create sends no signals
+        category_stats.rebuild(categories)
+        search.invalidate()
+        sitemaps.invalidate()
+
+        for model, rows in self.counts.items():
+            elapsed = self.timings[model]
+            self.stdout.write('{}: {} rows in {:.1f}s ({:.0f} rows/s)'.format(
+                model.__name__, rows, elapsed, rows / elapsed if elapsed else 0))
+        elapsed = time.monotonic() - start
+        rows = sum(self.counts.values())
+        self.stdout.write(self.style.SUCCESS(
+            'Generated {} rows in {:.1f}s ({:.0f} rows/s)'.format(rows, elapsed, rows / elapsed if elapsed else 0)
+        ))
+
+    @staticmethod
+    def next_id(model):
+        # ids are given explicitly, rows of the next batches can point to them without reading them back
+        return (model.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+
+    def insert(self, model, objects):
+        start = time.monotonic()
+        model.objects.bulk_create(objects, batch_size=self.batch_size)
+        self.timings[model] = self.timings.get(model, 0) + time.monotonic() - start
+        self.counts[model] = self.counts.get(model, 0) + len(objects)
+
+    def insert_all(self, model, objects):
+        objects = iter(objects)
+        while True:
+            batch = list(islice(objects, self.batch_size))
+            if not batch:
+                return
+            self.insert(model, batch)
+
+    @staticmethod
+    def placeholder(size):
+        """One stored image shared by every generated product, storage is touched once per size."""
+        name = 'img/placeholder-{}x{}.jpg'.format(*size)
+        if not default_storage.exists(name):
+            from PIL import Image
+
+            content = BytesIO()
+            Image.new('RGB', size, (230, 230, 230)).save(content, 'JPEG')
+            name = default_storage.save(name, ContentFile(content.getvalue()))
+        return name
+
+    def create_categories(self, count):
+        first_id = self.next_id(Category)
+        self.insert(Category, [
+            Category(id=pk, name='{} {}'.format(self.random.choice(ADJECTIVES), self.random.choice(NOUNS)),
+                     slug='category-{}'.format(pk))
+            for pk in range(first_id, first_id + count)
+        ])
+        return list(range(first_id, first_id + count))
+
+    def create_products(self, count, categories):
+        """Returns {product id: price}, cart lines are priced from it."""
+        thumbnail = self.placeholder(THUMBNAIL_SIZE)
+        big_image = self.placeholder(BIG_IMAGE_SIZE)
+        first_id = self.next_id(Product)
+        prices = {}
+
+        def products():
+            for pk in range(first_id, first_id + count):
+                # many cheap accessories, few expensive bikes
+                price = Decimal(min(round(self.random.lognormvariate(4, 1.2), 2), 99999)).quantize(Decimal('0.01'))
+                on_sale = self.random.random() < 0.2
+                prices[pk] = price
+                title = '{} {} {}'.format(self.random.choice(ADJECTIVES), self.random.choice(NOUNS), pk)
+                yield Product(
+                    id=pk, title=title, slug='product-{}'.format(pk),
+                    description='{} for everyday riding.'.format(title),
+                    availability=0 if self.random.random() < 0.1 else self.random.randint(1, 200),
+                    thumbnail_image=thumbnail, big_image=big_image,
+                    price=price, old_price=(price * Decimal('1.25')).quantize(Decimal('0.01')) if on_sale else 0,
+                    category_id=self.random.choice(categories),
+                )
+
+        self.insert_all(Product, products())
+        return prices
+
+    def create_customers(self, count):
+        # hashing is slow on purpose, every account shares one hash
+        password = make_password(PASSWORD)
+        first_user_id = self.next_id(User)
+        first_customer_id = self.next_id(Customer)
+        for start in range(0, count, self.batch_size):
+            size = min(self.batch_size, count - start)
+            users = []
+            customers = []
+            for offset in range(start, start + size):
+                user_id = first_user_id + offset
+                first_name = self.random.choice(FIRST_NAMES)
+                last_name = self.random.choice(LAST_NAMES)
+                users.append(User(
+                    id=user_id, username='user{}'.format(user_id), password=password,
+                    first_name=first_name, last_name=last_name, email='user{}@example.com'.format(user_id),
+                ))
+                customers.append(Customer(
+                    id=first_customer_id + offset, user_id=user_id,
+                    phone_number='+7{:010d}'.format(self.random.randrange(10 ** 10)),
+                    address='{} {}'.format(self.random.choice(STREETS), self.random.randint(1, 150)),
+                ))
+            with transaction.atomic():
+                self.insert(User, users)
+                self.insert(Customer, customers)
+        return list(range(first_customer_id, first_customer_id + count))
+
+    def create_carts(self, count, customers, prices, max_lines, ordered):
+        product_ids = list(prices)
+        cart_id = self.next_id(Cart)
+        line_id = self.next_id(CartProduct)
+        order_id = self.next_id(Order)
+        for start in range(0, count, self.batch_size):
+            carts, lines, orders = [], [], []
+            for _ in range(min(self.batch_size, count - start)):
+                customer_id = self.random.choice(customers)
+                in_order = self.random.random() < ordered
+                line_count = 0
+                for product_id in self.random.sample(product_ids, min(self.random.randint(1, max_lines),
+                                                                      len(product_ids))):
+                    quantity = self.random.choice((1, 1, 1, 2, 3))
+                    lines.append(CartProduct(
+                        id=line_id, customer_id=customer_id, cart_id=cart_id, product_id=product_id,
+                        quantity=quantity, final_price=prices[product_id] * quantity,
+                    ))
+                    line_count += 1
+                    line_id += 1
+                # totals with promotions and shipping are set by the pricing engine below
+                carts.append(Cart(
+                    id=cart_id, owner_id=customer_id, total_products=line_count, in_order=in_order,
+                ))
+                if in_order:
+                    orders.append(Order(
+                        id=order_id, customer_id=customer_id, cart_id=cart_id,
+                        first_name=self.random.choice(FIRST_NAMES), last_name=self.random.choice(LAST_NAMES),
+                        phone_number='+7{:010d}'.format(self.random.randrange(10 ** 10)),
+                        address='{} {}'.format(self.random.choice(STREETS), self.random.randint(1, 150)),
+                        status=self.random.choice(Order.STATUS_CHOICES)[0],
+                        buying_type=self.random.choice(Order.BUYING_TYPE_CHOICES)[0],
+                        order_date=(ORDER_BASE_DATE - timedelta(days=self.random.randint(0, 365))),
+                    ))
+                    order_id += 1
+                cart_id += 1
+            with transaction.atomic():
+                self.insert(Cart, carts)
+                self.insert(CartProduct, lines)
+                self.insert(Order, orders)
+                priced_at = time.monotonic()
+                pricing.reprice_carts([cart.id for cart in carts])
+                self.timings[Cart] += time.monotonic() - priced_at
@@ -0,0 +1,80 @@
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Runs in a fresh interpreter, the way a new gunicorn worker starts
+SCRIPT = '''
+import json, sys, time
+start = time.perf_counter()
+from mysite.wsgi import application
+loaded = time.perf_counter()
+timings = {}
+if %(warm_up)r:
+    from web.warmup import warm_up
+    timings = warm_up()
+from django.test import Client
+client = Client(HTTP_HOST='127.0.0.1')
+requests = []
+for _ in range(2):
+    request_start = time.perf_counter()
+    status = client.get(%(url)r).status_code
+    requests.append((status, time.perf_counter() - request_start))
+print(json.dumps({'load': loaded - start, 'warm_up': timings, 'requests': requests}))
+'''
+
+
+class Command(BaseCommand):
+    help = 'Measures the import time per module, the warm-up and the first requests of a new worker'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=20, help='Slowest modules and packages listed')
+        parser.add_argument('--url', default='/', help='Page requested after start-up')
+        parser.add_argument('--no-warm-up', action='store_true', help='Measure a cold first request instead')
+
+    def handle(self, *args, **options):
+        env = dict(os.environ, WARM_UP='False')
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', SCRIPT % {
+                'warm_up': not options['no_warm_up'], 'url': options['url'],
+            }],
+            capture_output=True, text=True, env=env,
+        )
+        if result.returncode:
+            raise CommandError(result.stderr[-2000:])
+        report = json.loads(result.stdout.strip().splitlines()[-1])
+        modules = self.parse_importtime(result.stderr)
+
+        self.stdout.write('Slowest imports (cumulative ms, self ms, module):')
+        for name, own, cumulative in sorted(modules, key=lambda module: -module[2])[:options['top']]:
+            self.stdout.write('{:10.1f} {:10.1f}  {}'.format(cumulative / 1000, own / 1000, name))
+
+        packages = defaultdict(int)
+        for name, own, _ in modules:
+            packages[name.split('.')[0]] += own
+        self.stdout.write('\nImport time per top-level package (ms):')
+        for package, own in sorted(packages.items(), key=lambda item: -item[1])[:options['top']]:
+            self.stdout.write('{:10.1f}  {}'.format(own / 1000, package))
+
+        self.stdout.write('\nApplication loaded in {:.2f}s'.format(report['load']))
+        for step, seconds in report['warm_up'].items():
+            self.stdout.write('Warm-up {}: {:.2f}s'.format(step, seconds))
+        for number, (status, seconds) in enumerate(report['requests'], 1):
+            self.stdout.write('Request {} to {}: {} in {:.3f}s'.format(number, options['url'], status, seconds))
+        total = report['load'] + sum(report['warm_up'].values()) + report['requests'][0][1]
+        self.stdout.write(self.style.SUCCESS('First response {:.2f}s after start'.format(total)))
+
+    @staticmethod
+    def parse_importtime(output):
+        """[(module, self us, cumulative us)] from the output of python -X importtime."""
+        modules = []
+        for line in output.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            own, cumulative, name = line[len('import time:'):].split('|')
+            modules.append((name.strip(), int(own), int(cumulative)))
+        return modules
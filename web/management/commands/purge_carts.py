@@ -0,0 +1,62 @@
+import json
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+
+from web.models import Cart, CartProduct
+
+
+class Command(BaseCommand):
+    help = 'Deletes (and optionally archives) abandoned carts in small chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help='Carts untouched for this many days are abandoned')
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--sleep', type=float, default=0.1, help='Pause between chunks, in seconds')
+        parser.add_argument('--archive', help='Append deleted carts with their lines to this JSON lines file')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        # carts that made it into an order are never abandoned
+        abandoned = Cart.objects.filter(in_order=False, updated_at__lt=cutoff, order__isnull=True)
+        archive = open(options['archive'], 'a') if options['archive'] else None
+        start = time.monotonic()
+        carts = rows = 0
+        last_id = 0
+        try:
+            while True:
+                cart_ids = list(
+                    abandoned.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:options['chunk_size']]
+                )
+                if not cart_ids:
+                    break
+                last_id = cart_ids[-1]
+                with transaction.atomic():
+                    # the filter is repeated so a cart touched since the select is kept
+                    chunk = abandoned.filter(id__in=cart_ids)
+                    if archive:
+                        self.archive(archive, chunk)
+                    deleted, _ = chunk.delete()
+                rows += deleted
+                carts += len(cart_ids)
+                time.sleep(options['sleep'])
+        finally:
+            if archive:
+                archive.close()
+        elapsed = time.monotonic() - start
+        self.stdout.write(self.style.SUCCESS(
+            'Purged {} carts, {} rows in {:.1f}s ({:.0f} rows/s)'.format(
+                carts, rows, elapsed, rows / elapsed if elapsed else 0)
+        ))
+
+    @staticmethod
+    def archive(archive, carts):
+        carts = {cart['id']: dict(cart, lines=[]) for cart in carts.values()}
+        for line in CartProduct.objects.filter(cart_id__in=carts).values():
+            carts[line['cart_id']]['lines'].append(line)
+        for cart in carts.values():
+            archive.write(json.dumps(cart, cls=DjangoJSONEncoder) + '\n')
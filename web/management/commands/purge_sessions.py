@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from mysite.sessions import CLEANUP_CHUNK_SIZE, SessionStore
+
+
+class Command(BaseCommand):
+    help = 'Deletes expired sessions from the database in bounded chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=CLEANUP_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        deleted = SessionStore.clear_expired(chunk_size=options['chunk_size'])
+        elapsed = time.monotonic() - start
+        self.stdout.write(self.style.SUCCESS(
+            'Deleted {} sessions in {:.1f}s ({:.0f} rows/s)'.format(deleted, elapsed, deleted / elapsed if elapsed else 0)
+        ))
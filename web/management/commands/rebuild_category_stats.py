@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from web.category_stats import REBUILD_BATCH_SIZE, rebuild
+
+
+class Command(BaseCommand):
+    help = 'Recounts the per-category product stats from the Product table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('categories', nargs='*', type=int, help='Category ids (default: all categories)')
+        parser.add_argument('--batch-size', type=int, default=REBUILD_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        rebuilt = rebuild(options['categories'] or None, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            'Rebuilt stats of {} categories in {:.1f}s'.format(rebuilt, time.monotonic() - start)
+        ))
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from web.pricing import REPRICE_BATCH_SIZE, reprice_open_carts, reprice_queued
+
+
+class Command(BaseCommand):
+    help = ('Reprices the open carts holding the products queued after a price or pricing rule change, '
+            'or with --all every open cart')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=REPRICE_BATCH_SIZE)
+        parser.add_argument('--all', action='store_true',
+                            help='Reprice every open cart with the current prices, promotions and shipping rules')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep running and reprice the queue every this many seconds')
+
+    def handle(self, *args, **options):
+        if options['all']:
+            start = time.monotonic()
+            repriced = reprice_open_carts(batch_size=options['batch_size'])
+            elapsed = time.monotonic() - start
+            self.stdout.write(self.style.SUCCESS(
+                'Repriced {} carts in {:.1f}s ({:.0f} carts/s)'.format(
+                    repriced, elapsed, repriced / elapsed if elapsed else 0)
+            ))
+            return
+        while True:
+            start = time.monotonic()
+            repriced = reprice_queued(batch_size=options['batch_size'])
+            if repriced or not options['interval']:
+                self.stdout.write(self.style.SUCCESS(
+                    'Repriced {} carts in {:.1f}s'.format(repriced, time.monotonic() - start)
+                ))
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
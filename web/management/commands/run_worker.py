@@ -0,0 +1,49 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from web.cdn import send_purges
+from web.inventory import fold
+from web.pricing import reprice_queued
+
+
+logger = logging.getLogger(__name__)
+
+# (name, function returning how many items it handled, seconds between two runs)
+JOBS = (
+    ('reprice_carts', reprice_queued, 10),
+    # Product.availability follows the stock shards, see web.inventory.fold
+    ('fold_inventory', fold, 60),
+    ('send_cdn_purges', send_purges, 10),
+)
+
+
+class Command(BaseCommand):
+    help = 'Runs the queues and periodic jobs of the shop in one process, the worker dyno of the Procfile'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run every job once and stop')
+
+    def handle(self, *args, **options):
+        next_runs = {name: 0 for name, _, _ in JOBS}
+        while True:
+            for name, job, interval in JOBS:
+                start = time.monotonic()
+                if start < next_runs[name]:
+                    continue
+                # a long running process keeps no broken or expired connection
+                close_old_connections()
+                try:
+                    handled = job()
+                except Exception:
+                    # tried again on its next run, the other jobs go on
+                    logger.exception('%s failed', name)
+                else:
+                    if handled:
+                        self.stdout.write('{}: {} in {:.1f}s'.format(name, handled, time.monotonic() - start))
+                next_runs[name] = start + interval
+            if options['once']:
+                return
+            time.sleep(1)
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from web.cdn import SEND_BATCH_SIZE, send_purges
+
+
+class Command(BaseCommand):
+    help = 'Sends the queued surrogate key purges to the CDN'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=SEND_BATCH_SIZE)
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep running and send the queue every this many seconds, e.g. on a worker dyno')
+
+    def handle(self, *args, **options):
+        while True:
+            start = time.monotonic()
+            purged = send_purges(batch_size=options['batch_size'])
+            if purged or not options['interval']:
+                self.stdout.write(self.style.SUCCESS(
+                    'Purged {} keys in {:.1f}s'.format(purged, time.monotonic() - start)
+                ))
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from web.orders import NOTIFICATION_BATCH_SIZE, send_notifications
+
+
+class Command(BaseCommand):
+    help = 'Sends the queued order status e-mails to customers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=NOTIFICATION_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        sent, skipped, failed = send_notifications(batch_size=options['batch_size'])
+        if failed:
+            self.stderr.write('{} e-mails were refused, they are tried again on the next runs'.format(failed))
+        self.stdout.write(self.style.SUCCESS(
+            'Sent {} e-mails in {:.1f}s, skipped {} without an e-mail address'.format(
+                sent, time.monotonic() - start, skipped)
+        ))
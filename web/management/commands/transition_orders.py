@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from web.models import Order
+from web.orders import TRANSITION_BATCH_SIZE, InvalidTransition, transition
+
+
+STATUSES = [status for status, _ in Order.STATUS_CHOICES]
+
+
+class Command(BaseCommand):
+    help = 'Moves every order allowed to reach a status, e.g. the end-of-day fulfillment run'
+
+    def add_arguments(self, parser):
+        parser.add_argument('status', choices=STATUSES)
+        parser.add_argument('--from-status', choices=STATUSES, help='Only move orders currently in this status')
+        parser.add_argument('--until', help='Only move orders to deliver on or before this date (YYYY-MM-DD)')
+        parser.add_argument('--batch-size', type=int, default=TRANSITION_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        orders = Order.objects.all()
+        if options['from_status']:
+            orders = orders.filter(status=options['from_status'])
+        if options['until']:
+            orders = orders.filter(order_date__lte=options['until'])
+        start = time.monotonic()
+        try:
+            moved = transition(orders, options['status'], batch_size=options['batch_size'])
+        except InvalidTransition as error:
+            raise CommandError(error)
+        elapsed = time.monotonic() - start
+        self.stdout.write(self.style.SUCCESS(
+            'Moved {} orders to {} in {:.1f}s ({:.0f} orders/s)'.format(
+                moved, options['status'], elapsed, moved / elapsed if elapsed else 0)
+        ))
@@ -0,0 +1,199 @@
+import hashlib
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from itertools import repeat
+
+import django
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage, get_storage_class
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from mysite.storages import CONTENT_NAME_RE
+
+from . import cdn
+from .models import Product
+from .uploads import UPLOAD_DIR
+
+
+DEDUP_BATCH_SIZE = 200
+JPEG_QUALITY = 85
+IMAGE_FIELDS = ('thumbnail_image', 'big_image')
+# optimized copies of the originals, under the same content name
+VARIANT_DIR = UPLOAD_DIR + 'optimized/'
+# unreferenced files younger than this may be uploads of a product being edited
+ORPHAN_AGE = timedelta(days=1)
+
+_storage = None
+
+
+def _worker_storage():
+    # workers are spawned, not forked, so they share no database or S3 connection with the command
+    global _storage
+    if _storage is None:
+        _storage = get_storage_class()()
+    return _storage
+
+
+def content_name(data, name, directory=UPLOAD_DIR):
+    """'img/<sha256 of the content>.<extension of name>', the same content always gets the same name."""
+    extension = os.path.splitext(name)[1].lower() or '.jpg'
+    return '{}{}{}'.format(directory, hashlib.sha256(data).hexdigest(), extension)
+
+
+def variant_name(original):
+    """Name of the optimized copy of a content-named original."""
+    return VARIANT_DIR + os.path.basename(original)
+
+
+def optimize(data, quality=JPEG_QUALITY):
+    """
+    The image encoded again without metadata, or data when that is not
+    smaller. The EXIF orientation is applied to the pixels first and the ICC
+    profile is kept, so the variant looks the same as the original.
+    """
+    try:
+        image = Image.open(io.BytesIO(data))
+        image_format = image.format
+        icc_profile = image.info.get('icc_profile')
+        image = ImageOps.exif_transpose(image)
+        output = io.BytesIO()
+        if image_format == 'JPEG':
+            image.convert('RGB').save(
+                output, 'JPEG', quality=quality, optimize=True, progressive=True, icc_profile=icc_profile,
+            )
+        elif image_format == 'PNG':
+            image.save(output, 'PNG', optimize=True, icc_profile=icc_profile)
+        else:
+            return data
+    except Exception:
+        return data
+    return output.getvalue() if output.tell() < len(data) else data
+
+
+def _store(storage, name, body, dry_run):
+    """Bytes written to store body as name, nothing when the name is already there."""
+    if storage.exists(name):
+        return 0
+    if not dry_run:
+        saved = storage.save(name, ContentFile(body))
+        if saved != name:
+            # another worker stored the same content meanwhile and the storage picked a new name
+            storage.delete(saved)
+            return 0
+    return len(body)
+
+
+def process(name, quality, dry_run=False):
+    """
+    Runs in a worker: keeps the stored image, byte for byte, under its content
+    name and writes an optimized variant of it when that is smaller. Returns
+    (name, original, target, size, target size, bytes written, error), target
+    being the file the products should use.
+    """
+    storage = _worker_storage()
+    try:
+        with storage.open(name) as f:
+            data = f.read()
+    except Exception as e:
+        return name, None, None, 0, 0, 0, str(e) or type(e).__name__
+    original = content_name(data, name)
+    written = _store(storage, original, data, dry_run)
+    variant = variant_name(original)
+    if storage.exists(variant):
+        return name, original, variant, len(data), storage.size(variant), written, None
+    body = optimize(data, quality)
+    if len(body) >= len(data):
+        return name, original, original, len(data), len(data), written, None
+    written += _store(storage, variant, body, dry_run)
+    return name, original, variant, len(data), len(body), written, None
+
+
+def replace(name, target):
+    """Point every product image stored as name to target, returns the product ids."""
+    ids = set()
+    now = timezone.now()
+    with transaction.atomic():
+        for field in IMAGE_FIELDS:
+            products = Product.objects.filter(**{field: name})
+            ids.update(products.values_list('id', flat=True))
+            # not saved one by one: the images are the same, only their names change
+            products.update(**{field: target, 'updated_at': now})
+        cdn.purge(*[cdn.product_key(product_id) for product_id in ids])
+    return ids
+
+
+def dedup(workers=None, batch_size=DEDUP_BATCH_SIZE, quality=JPEG_QUALITY, after=0, dry_run=False, progress=None):
+    """
+    Move the product images to content names, one stored original per
+    distinct content, and point the products to its optimized variant. The
+    old file is deleted once its content is stored under its content name.
+    Images already under a content name are not read again, so an
+    interrupted run picks up where it stopped. With dry_run nothing is
+    written, the totals tell what a run would do. progress(last product id,
+    totals) is called per batch.
+    """
+    totals = dict(images=0, read=0, served=0, written=0, deleted=0, errors=0)
+    # files a dry run would have written already, they are counted once
+    planned = set()
+    last_id = after
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=django.setup) as pool:
+        while True:
+            rows = list(
+                Product.objects.filter(id__gt=last_id).order_by('id').values_list('id', *IMAGE_FIELDS)[:batch_size]
+            )
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            names = sorted({name for row in rows for name in row[1:] if name and not CONTENT_NAME_RE.search(name)})
+            results = pool.map(process, names, repeat(quality), repeat(dry_run))
+            for name, original, target, size, target_size, written, error in results:
+                if error:
+                    totals['errors'] += 1
+                    continue
+                totals['images'] += 1
+                totals['read'] += size
+                totals['served'] += target_size
+                totals['deleted'] += size
+                if dry_run:
+                    if original not in planned:
+                        totals['written'] += written
+                    planned.update((original, target))
+                    continue
+                totals['written'] += written
+                replace(name, target)
+                # the same bytes are kept under the content name
+                default_storage.delete(name)
+            if progress:
+                progress(last_id, totals)
+    return totals
+
+
+def delete_orphans(age=ORPHAN_AGE, dry_run=False):
+    """
+    Delete the files directly in img/ that no Product image uses, e.g.
+    collision-suffixed copies. Only Product points into img/; a model storing
+    files there must be added to the names kept here. Content-named originals
+    and files younger than age are kept. Returns (files, bytes).
+    """
+    used = set()
+    for row in Product.objects.values_list(*IMAGE_FIELDS).iterator():
+        used.update(row)
+    deleted = size = 0
+    _, files = default_storage.listdir(UPLOAD_DIR)
+    for filename in files:
+        name = UPLOAD_DIR + filename
+        if name in used or CONTENT_NAME_RE.search(name):
+            continue
+        if default_storage.get_modified_time(name) > timezone.now() - age:
+            continue
+        size += default_storage.size(name)
+        if not dry_run:
+            default_storage.delete(name)
+        deleted += 1
+    return deleted, size
@@ -0,0 +1,144 @@
+import os
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.http import Http404, HttpResponse
+from prometheus_client import CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.exposition import CONTENT_TYPE_LATEST
+
+
+# Every gunicorn worker writes its samples to files in PROMETHEUS_MULTIPROC_DIR
+# (set up by gunicorn.conf.py), /metrics adds up the files of all workers.
+# Without it, e.g. under runserver, the samples of this process are served.
+MULTIPROCESS = bool(os.environ.get('PROMETHEUS_MULTIPROC_DIR'))
+REGISTRY = CollectorRegistry()
+
+REQUEST_LATENCY = Histogram(
+    'web_request_duration_seconds', 'Time spent on a request, by URL name',
+    ['view', 'method'], registry=REGISTRY,
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+RESPONSES = Counter(
+    'web_responses_total', 'Responses by URL name and status code',
+    ['view', 'method', 'status'], registry=REGISTRY,
+)
+DB_QUERIES = Histogram(
+    'web_request_db_queries', 'Database queries made by a request, by URL name',
+    ['view'], registry=REGISTRY,
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+DB_QUERY_DURATION = Histogram(
+    'web_db_query_duration_seconds', 'Time spent on a database query, by URL name',
+    ['view'], registry=REGISTRY,
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+CACHE_GETS = Counter(
+    'web_cache_gets_total', 'Keys read from the cache, by result (hit or miss)',
+    ['result'], registry=REGISTRY,
+)
+CART_MUTATIONS = Counter(
+    'web_cart_mutations_total', 'Cart changes, by action (add, remove, change_qty)',
+    ['action'], registry=REGISTRY,
+)
+CHECKOUTS = Counter(
+    'web_checkouts_total', 'Checkouts, by result (success, invalid_form, out_of_stock, error)',
+    ['result'], registry=REGISTRY,
+)
+
+UNRESOLVED = '<unresolved>'
+# clients may send any method, the others share one label so they can not add series
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+OTHER_METHOD = 'other'
+
+
+class MailQueueCollector:
+    """Order e-mails waiting for send_order_notifications, counted on every scrape."""
+
+    def collect(self):
+        from .models import OrderNotification
+        yield GaugeMetricFamily(
+            'web_mail_queue_depth', 'Queued order e-mails not sent yet',
+            value=OrderNotification.objects.filter(sent_at__isnull=True, skipped_at__isnull=True).count(),
+        )
+
+
+QUEUE_REGISTRY = CollectorRegistry()
+QUEUE_REGISTRY.register(MailQueueCollector())
+
+
+def record_cache_gets(hits, misses):
+    if hits:
+        CACHE_GETS.labels('hit').inc(hits)
+    if misses:
+        CACHE_GETS.labels('miss').inc(misses)
+
+
+class QueryTimer:
+    """connection.execute_wrapper counting and timing the queries of one request."""
+
+    def __init__(self):
+        self.durations = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.durations.append(time.perf_counter() - start)
+
+
+class MetricsMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        timer = QueryTimer()
+        with connection.execute_wrapper(timer):
+            response = self.get_response(request)
+        match = request.resolver_match
+        view = (match.url_name or match.view_name) if match else UNRESOLVED
+        method = request.method if request.method in METHODS else OTHER_METHOD
+
+        def record():
+            REQUEST_LATENCY.labels(view, method).observe(time.perf_counter() - start)
+            RESPONSES.labels(view, method, response.status_code).inc()
+            DB_QUERIES.labels(view).observe(len(timer.durations))
+            query_duration = DB_QUERY_DURATION.labels(view)
+            for duration in timer.durations:
+                query_duration.observe(duration)
+
+        if response.streaming:
+            # the body is made after the view returned, e.g. the order exports
+            response.streaming_content = self.stream(response.streaming_content, timer, record)
+        else:
+            record()
+        return response
+
+    @staticmethod
+    def stream(content, timer, record):
+        """Streamed content whose queries are counted, recorded once the last chunk is sent or the client left."""
+        try:
+            with connection.execute_wrapper(timer):
+                yield from content
+        finally:
+            record()
+
+
+# metrics
+def metrics_view(request):
+    """Prometheus text format, behind METRICS_TOKEN as a bearer token when one is set."""
+    if settings.METRICS_TOKEN:
+        if request.META.get('HTTP_AUTHORIZATION') != 'Bearer ' + settings.METRICS_TOKEN:
+            return HttpResponse('Unauthorized', status=401)
+    elif not settings.DEBUG:
+        raise Http404
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry) + generate_latest(QUEUE_REGISTRY), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,39 @@
+# Generated by Django 3.2.6 on 2026-10-19 18:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0007_auto_20211113_1955'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShippingRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, verbose_name='Rule name')),
+                ('min_subtotal', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Applies from cart subtotal')),
+                ('price', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Shipping price')),
+                ('is_active', models.BooleanField(default=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Promotion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, verbose_name='Promotion name')),
+                ('kind', models.CharField(choices=[('percent', 'Percent off'), ('fixed', 'Fixed amount off')], default='percent', max_length=20, verbose_name='Promotion type')),
+                ('value', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Percent or amount')),
+                ('min_subtotal', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Applies from cart subtotal')),
+                ('starts_at', models.DateTimeField(blank=True, null=True)),
+                ('ends_at', models.DateTimeField(blank=True, null=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='web.category', verbose_name='Only for category')),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='web.product', verbose_name='Only for product')),
+            ],
+        ),
+    ]
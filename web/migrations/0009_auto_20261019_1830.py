@@ -0,0 +1,22 @@
+# Generated by Django 3.2.6 on 2026-10-19 18:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0008_promotion_shippingrule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='Last change'),
+        ),
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(fields=['in_order', 'updated_at'], name='web_cart_in_orde_a9f90a_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.2.6 on 2026-10-19 18:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0012_inventorycheckpoint_stockmovement_stockshard'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryStats',
+            fields=[
+                ('category', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='web.category', verbose_name='Category')),
+                ('product_count', models.PositiveIntegerField(default=0, verbose_name='Products')),
+                ('in_stock_count', models.PositiveIntegerField(default=0, verbose_name='Products in stock')),
+                ('sale_count', models.PositiveIntegerField(default=0, verbose_name='Products on sale')),
+                ('min_price', models.DecimalField(blank=True, decimal_places=2, max_digits=8, null=True, verbose_name='Lowest price')),
+                ('max_price', models.DecimalField(blank=True, decimal_places=2, max_digits=8, null=True, verbose_name='Highest price')),
+            ],
+            options={
+                'verbose_name_plural': 'Category stats',
+            },
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 3.2.6 on 2026-10-19 18:44
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fix_delivery_orders(apps, schema_editor):
+    # delivery orders were stored with the 'in_progress' status key
+    Order = apps.get_model('web', 'Order')
+    Order.objects.filter(buying_type='in_progress').update(buying_type='delivery')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('web', '0013_categorystats'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='buying_type',
+            field=models.CharField(choices=[('self', 'Pickup'), ('delivery', 'Delivery')], default='self', max_length=255, verbose_name='Order type'),
+        ),
+        migrations.RunPython(fix_delivery_orders, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='OrderStatusChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('old_status', models.CharField(choices=[('new', 'New order'), ('in_progress', 'Order in progress'), ('is_ready', 'Order is ready'), ('is_completed', 'Order completed')], max_length=255, verbose_name='Previous status')),
+                ('new_status', models.CharField(choices=[('new', 'New order'), ('in_progress', 'Order in progress'), ('is_ready', 'Order is ready'), ('is_completed', 'Order completed')], max_length=255, verbose_name='New status')),
+                ('changed_at', models.DateTimeField(auto_now_add=True, verbose_name='Change date')),
+                ('changed_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Changed by')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_history', to='web.order', verbose_name='Order')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='OrderNotification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('new', 'New order'), ('in_progress', 'Order in progress'), ('is_ready', 'Order is ready'), ('is_completed', 'Order completed')], max_length=255, verbose_name='Order status')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Queued at')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='Sent at')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='web.order', verbose_name='Order')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='ordernotification',
+            index=models.Index(fields=['sent_at', 'id'], name='web_orderno_sent_at_3d494d_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 3.2.6 on 2026-10-19 18:49
+
+from django.db import migrations, transaction
+
+
+CHUNK_SIZE = 5000
+
+
+def drop_order_links(apps, schema_editor):
+    """
+    Delete the Customer.orders join rows, one chunk per transaction. Deleted
+    rows are done, so an interrupted run goes on where it stopped when migrate
+    is run again. Order.customer is what the views read, it stays the owner of
+    an order whatever the join rows said.
+    """
+    Link = apps.get_model('web', 'Customer').orders.through
+    db = schema_editor.connection.alias
+    while True:
+        with transaction.atomic(using=db):
+            link_ids = list(Link.objects.using(db).order_by('id').values_list('id', flat=True)[:CHUNK_SIZE])
+            if not link_ids:
+                break
+            Link.objects.using(db).filter(id__in=link_ids).delete()
+
+
+class Migration(migrations.Migration):
+    # every chunk commits on its own
+    atomic = False
+
+    dependencies = [
+        ('web', '0014_auto_20261019_1844'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_order_links, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='customer',
+            name='orders',
+        ),
+    ]
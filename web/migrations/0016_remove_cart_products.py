@@ -0,0 +1,51 @@
+# Generated by Django 3.2.6 on 2026-10-19 18:50
+
+from django.db import migrations, transaction
+
+
+CHUNK_SIZE = 5000
+
+
+def drop_cart_links(apps, schema_editor):
+    """
+    Move the Cart.products join rows onto CartProduct.cart and delete them,
+    one chunk per transaction. Deleted rows are done, so an interrupted run
+    goes on where it stopped when migrate is run again.
+    """
+    CartProduct = apps.get_model('web', 'CartProduct')
+    Link = apps.get_model('web', 'Cart').products.through
+    db = schema_editor.connection.alias
+    while True:
+        with transaction.atomic(using=db):
+            links = list(
+                Link.objects.using(db).order_by('id').values_list('id', 'cart_id', 'cartproduct_id')[:CHUNK_SIZE]
+            )
+            if not links:
+                break
+            carts = dict(
+                CartProduct.objects.using(db).filter(id__in=[line_id for _, _, line_id in links])
+                .values_list('id', 'cart_id')
+            )
+            # the join table is what the cart pages showed, it wins over the foreign key
+            moved = {line_id: cart_id for _, cart_id, line_id in links if carts.get(line_id, cart_id) != cart_id}
+            CartProduct.objects.using(db).bulk_update(
+                [CartProduct(id=line_id, cart_id=cart_id) for line_id, cart_id in moved.items()], ['cart'],
+            )
+            Link.objects.using(db).filter(id__in=[link_id for link_id, _, _ in links]).delete()
+
+
+class Migration(migrations.Migration):
+    # every chunk commits on its own
+    atomic = False
+
+    dependencies = [
+        ('web', '0015_remove_customer_orders'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_cart_links, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='cart',
+            name='products',
+        ),
+    ]
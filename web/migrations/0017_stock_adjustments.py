@@ -0,0 +1,57 @@
+# Generated by Django 3.2.6 on 2026-10-19 19:06
+
+from django.db import migrations, models, transaction
+
+
+CHUNK_SIZE = 1000
+# web.inventory.SHARDS when this migration was written
+SHARDS = 8
+
+
+def seed_shards(apps, schema_editor):
+    """
+    Split Product.availability over the stock shards of every product that has
+    none yet, so the shards hold the stock of the whole catalog from now on.
+    One chunk of products per transaction, seeded products are skipped when
+    migrate is run again.
+    """
+    Product = apps.get_model('web', 'Product')
+    StockShard = apps.get_model('web', 'StockShard')
+    db = schema_editor.connection.alias
+    last_id = 0
+    while True:
+        with transaction.atomic(using=db):
+            products = list(
+                Product.objects.using(db).filter(id__gt=last_id, stock_shards__isnull=True)
+                .order_by('id').values_list('id', 'availability')[:CHUNK_SIZE]
+            )
+            if not products:
+                break
+            last_id = products[-1][0]
+            StockShard.objects.using(db).bulk_create(
+                [
+                    StockShard(product_id=product_id, shard=shard,
+                               available=availability // SHARDS + (shard < availability % SHARDS))
+                    for product_id, availability in products
+                    for shard in range(SHARDS)
+                ],
+                ignore_conflicts=True,
+            )
+
+
+class Migration(migrations.Migration):
+    # every chunk commits on its own
+    atomic = False
+
+    dependencies = [
+        ('web', '0016_remove_cart_products'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='stockmovement',
+            name='kind',
+            field=models.CharField(choices=[('receipt', 'Receipt'), ('reservation', 'Reservation'), ('release', 'Released reservation'), ('sale', 'Sale'), ('return', 'Return'), ('adjustment', 'Stock count adjustment')], max_length=20, verbose_name='Movement type'),
+        ),
+        migrations.RunPython(seed_shards, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.6 on 2026-10-19 19:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0017_stock_adjustments'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CdnPurge',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=100, verbose_name='Surrogate key')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Queued at')),
+            ],
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.6 on 2026-10-19 19:12
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0020_searchchange'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='order_date',
+            field=models.DateField(db_index=True, default=django.utils.timezone.now, verbose_name='Date of receipt of the order'),
+        ),
+    ]
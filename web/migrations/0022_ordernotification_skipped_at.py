@@ -0,0 +1,26 @@
+# Generated by Django 3.2.6 on 2026-10-19 19:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0021_order_date_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='ordernotification',
+            name='web_orderno_sent_at_3d494d_idx',
+        ),
+        migrations.AddField(
+            model_name='ordernotification',
+            name='skipped_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Skipped at'),
+        ),
+        migrations.AddIndex(
+            model_name='ordernotification',
+            index=models.Index(fields=['sent_at', 'skipped_at', 'id'], name='web_orderno_sent_at_748d4c_idx'),
+        ),
+    ]
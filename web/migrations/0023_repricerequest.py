@@ -0,0 +1,21 @@
+# Generated by Django 3.2.6 on 2026-10-19 19:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0022_ordernotification_skipped_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RepriceRequest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_id', models.PositiveIntegerField(verbose_name='Product')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Queued at')),
+            ],
+        ),
+    ]
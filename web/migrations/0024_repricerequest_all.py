@@ -0,0 +1,18 @@
+# Generated by Django 3.2.6 on 2026-10-19 19:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0023_repricerequest'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='repricerequest',
+            name='product_id',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Product'),
+        ),
+    ]
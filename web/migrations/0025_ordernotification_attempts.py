@@ -0,0 +1,18 @@
+# Generated by Django 3.2.6 on 2026-10-19 19:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0024_repricerequest_all'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ordernotification',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Failed attempts'),
+        ),
+    ]
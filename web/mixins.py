@@ -17,8 +17,8 @@ class CartMixin(View):
             if not cart:
                 cart = Cart.objects.create(owner=customer)
         else:
-            cart = Cart.objects.filter(for_anonymous_user=True).first()
+            cart = Cart.objects.filter(for_anonymous_users=True).first()
             if not cart:
-                cart = Cart.objects.create(for_anonymous_user=True)
+                cart = Cart.objects.create(for_anonymous_users=True)
         self.cart = cart
         return super().dispatch(request, *args, **kwargs)
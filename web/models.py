@@ -1,10 +1,11 @@
 from django.db import models
 from django.core.exceptions import ValidationError
-from django.core.files.images import get_image_dimensions
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.utils import timezone
 
+from .uploads import image_dimensions
+
 
 User = get_user_model()
 
@@ -15,7 +16,7 @@ def check_image(image, size_w, size_h):
     if not image:
         raise ValidationError("No image!")
     else:
-        w, h = get_image_dimensions(image)
+        w, h = image_dimensions(image)
         if w != size_w:
             raise ValidationError("The image is {0} pixel wide. It's supposed to be {1}px".format(w, size_w))
         if h != size_h:
@@ -28,6 +29,7 @@ def check_image(image, size_w, size_h):
 class Category(models.Model):
     name = models.CharField(max_length=255, verbose_name='Category name')
     slug = models.SlugField(unique=True)
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Last change')
 
     def __str__(self):
         return self.name
@@ -54,6 +56,7 @@ class Product(models.Model):
     old_price = models.DecimalField(decimal_places=2, max_digits=12, default=0)
 
     category = models.ForeignKey(Category, verbose_name='Category', on_delete=models.CASCADE)
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Last change')
 
     def __str__(self):
         return self.title
@@ -62,13 +65,52 @@ class Product(models.Model):
         return reverse('product_detail', kwargs={'slug': self.slug})
 
     def clean(self):
-        check_image(self.thumbnail_image, 360, 480)
-        check_image(self.big_image, 600, 800)
+        # images are checked when they change, not read again on every save
+        saved = Product.objects.filter(pk=self.pk).values('thumbnail_image', 'big_image').first() or {}
+        if self.thumbnail_image.name != saved.get('thumbnail_image'):
+            check_image(self.thumbnail_image, 360, 480)
+        if self.big_image.name != saved.get('big_image'):
+            check_image(self.big_image, 600, 800)
 
     def get_model_name(self):
         return self.__class__.__name__.lower()
 
 
+# Products bought together, filled by the build_recommendations command
+class RelatedProduct(models.Model):
+    product = models.ForeignKey(Product, verbose_name='Product', on_delete=models.CASCADE,
+                                related_name='bought_together')
+    related = models.ForeignKey(Product, verbose_name='Related product', on_delete=models.CASCADE,
+                                related_name='recommended_for')
+    rank = models.PositiveSmallIntegerField(verbose_name='Rank')
+    score = models.PositiveIntegerField(verbose_name='Carts with both products')
+
+    def __str__(self):
+        return '{} -> {}'.format(self.product_id, self.related_id)
+
+    class Meta:
+        unique_together = ('product', 'rank')
+
+
+# Catalog figures per category, kept up to date by web.category_stats
+class CategoryStats(models.Model):
+    category = models.OneToOneField(Category, verbose_name='Category', on_delete=models.CASCADE,
+                                    primary_key=True, related_name='stats')
+    product_count = models.PositiveIntegerField(default=0, verbose_name='Products')
+    in_stock_count = models.PositiveIntegerField(default=0, verbose_name='Products in stock')
+    sale_count = models.PositiveIntegerField(default=0, verbose_name='Products on sale')
+    min_price = models.DecimalField(decimal_places=2, max_digits=8, null=True, blank=True,
+                                    verbose_name='Lowest price')
+    max_price = models.DecimalField(decimal_places=2, max_digits=8, null=True, blank=True,
+                                    verbose_name='Highest price')
+
+    def __str__(self):
+        return str(self.category_id)
+
+    class Meta:
+        verbose_name_plural = "Category stats"
+
+
 # ##### CART MODELS ##### #
 # Cart Product
 class CartProduct(models.Model):
@@ -89,18 +131,112 @@ class CartProduct(models.Model):
 # Cart
 class Cart(models.Model):
     owner = models.ForeignKey('Customer', verbose_name='Owner', null=True, on_delete=models.CASCADE)
-    products = models.ManyToManyField(CartProduct, blank=True, related_name='related_cart')
     total_products = models.PositiveIntegerField(default=0)
     final_price = models.DecimalField(max_digits=12, decimal_places=2, verbose_name='Final price', default=0)
     in_order = models.BooleanField(default=False)
     shipping_price = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name='Shipping price')
     for_anonymous_users = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Last change')
 
     def __str__(self):
         return str(self.id)
 
     class Meta:
         verbose_name_plural = "Cart"
+        indexes = [
+            # finds abandoned carts for purge_carts
+            models.Index(fields=['in_order', 'updated_at']),
+        ]
+
+
+# ##### INVENTORY MODELS ##### #
+# Stock movement ledger, rows are only ever inserted
+class StockMovement(models.Model):
+
+    KIND_RECEIPT = 'receipt'
+    KIND_RESERVATION = 'reservation'
+    KIND_RELEASE = 'release'
+    KIND_SALE = 'sale'
+    KIND_RETURN = 'return'
+    KIND_ADJUSTMENT = 'adjustment'
+
+    KIND_CHOICES = (
+        (KIND_RECEIPT, 'Receipt'),
+        (KIND_RESERVATION, 'Reservation'),
+        (KIND_RELEASE, 'Released reservation'),
+        (KIND_SALE, 'Sale'),
+        (KIND_RETURN, 'Return'),
+        (KIND_ADJUSTMENT, 'Stock count adjustment'),
+    )
+
+    product = models.ForeignKey(Product, verbose_name='Product', on_delete=models.CASCADE)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, verbose_name='Movement type')
+    # change of the available stock, negative for reservations and sales
+    quantity = models.IntegerField(verbose_name='Quantity')
+    order = models.ForeignKey('Order', verbose_name='Order', null=True, blank=True, on_delete=models.SET_NULL)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return '{} {} x{}'.format(self.kind, self.product_id, self.quantity)
+
+
+# A product's available stock is split over several rows,
+# so concurrent purchases of one product lock different rows
+class StockShard(models.Model):
+    product = models.ForeignKey(Product, verbose_name='Product', on_delete=models.CASCADE,
+                                related_name='stock_shards')
+    shard = models.PositiveSmallIntegerField()
+    available = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('product', 'shard')
+
+
+# Last ledger row folded into Product.availability
+class InventoryCheckpoint(models.Model):
+    last_movement_id = models.BigIntegerField(default=0)
+    folded_at = models.DateTimeField(auto_now=True)
+
+
+# ##### PRICING MODELS ##### #
+# Shipping rule
+class ShippingRule(models.Model):
+    name = models.CharField(max_length=255, verbose_name='Rule name')
+    min_subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0,
+                                       verbose_name='Applies from cart subtotal')
+    price = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name='Shipping price')
+    is_active = models.BooleanField(default=True)
+
+    def __str__(self):
+        return self.name
+
+
+# Promotion
+class Promotion(models.Model):
+
+    KIND_PERCENT = 'percent'
+    KIND_FIXED = 'fixed'
+
+    KIND_CHOICES = (
+        (KIND_PERCENT, 'Percent off'),
+        (KIND_FIXED, 'Fixed amount off'),
+    )
+
+    name = models.CharField(max_length=255, verbose_name='Promotion name')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default=KIND_PERCENT, verbose_name='Promotion type')
+    value = models.DecimalField(max_digits=12, decimal_places=2, verbose_name='Percent or amount')
+    category = models.ForeignKey(Category, verbose_name='Only for category', null=True, blank=True,
+                                 on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, verbose_name='Only for product', null=True, blank=True,
+                                on_delete=models.CASCADE)
+    min_subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0,
+                                       verbose_name='Applies from cart subtotal')
+    starts_at = models.DateTimeField(null=True, blank=True)
+    ends_at = models.DateTimeField(null=True, blank=True)
+    is_active = models.BooleanField(default=True)
+
+    def __str__(self):
+        return self.name
 
 
 # Customer
@@ -108,7 +244,6 @@ class Customer(models.Model):
     user = models.ForeignKey(User, verbose_name='User', on_delete=models.CASCADE)
     phone_number = models.CharField(max_length=20, null=True, blank=True)
     address = models.CharField(max_length=20, null=True, blank=True)
-    orders = models.ManyToManyField('Order', verbose_name="Customer's orders", related_name='related_customer')
 
     def __str__(self):
         return 'Buyer: {} {}'.format(self.user.first_name, self.user.last_name)
@@ -134,9 +269,17 @@ class Order(models.Model):
 
     BUYING_TYPE_CHOICES = (
         (BUYING_TYPE_SELF, 'Pickup'),
-        (STATUS_IN_PROGRESS, 'Delivery'),
+        (BUYING_TYPE_DELIVERY, 'Delivery'),
     )
 
+    # status: statuses it may move to, changed through web.orders.transition
+    TRANSITIONS = {
+        STATUS_NEW: (STATUS_IN_PROGRESS, STATUS_READY),
+        STATUS_IN_PROGRESS: (STATUS_READY,),
+        STATUS_READY: (STATUS_COMPLETED,),
+        STATUS_COMPLETED: (),
+    }
+
     customer = models.ForeignKey(Customer, verbose_name='Buyer', related_name='related_orders',
                                  on_delete=models.CASCADE)
     first_name = models.CharField(max_length=255, verbose_name='Name')
@@ -156,7 +299,75 @@ class Order(models.Model):
             default=BUYING_TYPE_SELF)
     comment = models.TextField(verbose_name='Comment for order', blank=True, null=True)
     created_at = models.DateTimeField(auto_now=True, verbose_name='Order creation date')
-    order_date = models.DateField(verbose_name='Date of receipt of the order', default=timezone.now)
+    order_date = models.DateField(verbose_name='Date of receipt of the order', default=timezone.now, db_index=True)
 
     def __str__(self):
         return str(self.id)
+
+
+# Every status change of an order, written by web.orders.transition
+class OrderStatusChange(models.Model):
+    order = models.ForeignKey(Order, verbose_name='Order', on_delete=models.CASCADE, related_name='status_history')
+    old_status = models.CharField(max_length=255, verbose_name='Previous status', choices=Order.STATUS_CHOICES)
+    new_status = models.CharField(max_length=255, verbose_name='New status', choices=Order.STATUS_CHOICES)
+    changed_by = models.ForeignKey(User, verbose_name='Changed by', null=True, blank=True,
+                                   on_delete=models.SET_NULL)
+    changed_at = models.DateTimeField(auto_now_add=True, verbose_name='Change date')
+
+    def __str__(self):
+        return '{}: {} -> {}'.format(self.order_id, self.old_status, self.new_status)
+
+
+# Customer e-mails waiting for the send_order_notifications command
+class OrderNotification(models.Model):
+    order = models.ForeignKey(Order, verbose_name='Order', on_delete=models.CASCADE, related_name='notifications')
+    status = models.CharField(max_length=255, verbose_name='Order status', choices=Order.STATUS_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Queued at')
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name='Sent at')
+    # the customer has no e-mail address, or the server refused it on every attempt
+    skipped_at = models.DateTimeField(null=True, blank=True, verbose_name='Skipped at')
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name='Failed attempts')
+
+    def __str__(self):
+        return '{}: {}'.format(self.order_id, self.status)
+
+    class Meta:
+        indexes = [models.Index(fields=['sent_at', 'skipped_at', 'id'])]
+
+
+# CDN surrogate keys waiting for the send_cdn_purges command, see web.cdn
+class CdnPurge(models.Model):
+    key = models.CharField(max_length=100, verbose_name='Surrogate key')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Queued at')
+
+    def __str__(self):
+        return self.key
+
+
+# Versions of cached data, bumped when the data changes, see web.versions
+class CacheVersion(models.Model):
+    name = models.CharField(max_length=100, primary_key=True)
+    version = models.PositiveBigIntegerField(default=1)
+
+    def __str__(self):
+        return '{} v{}'.format(self.name, self.version)
+
+
+# Saved and deleted catalog items, replayed by the search index of every process, see web.search
+class SearchChange(models.Model):
+    kind = models.CharField(max_length=20)
+    item_id = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return '{} {}'.format(self.kind, self.item_id)
+
+
+# Products whose open carts wait for the reprice_carts command, see web.pricing
+class RepriceRequest(models.Model):
+    # None for every open cart, after a promotion or shipping rule change
+    product_id = models.PositiveIntegerField(null=True, blank=True, verbose_name='Product')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Queued at')
+
+    def __str__(self):
+        return str(self.product_id)
@@ -0,0 +1,128 @@
+import logging
+import smtplib
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Order, OrderNotification, OrderStatusChange
+
+
+TRANSITION_BATCH_SIZE = 1000
+NOTIFICATION_BATCH_SIZE = 200
+# runs of send_notifications an e-mail is tried in before it is given up
+MAX_SEND_ATTEMPTS = 5
+STATUS_NAMES = dict(Order.STATUS_CHOICES)
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidTransition(Exception):
+
+    def __init__(self, old_status, new_status):
+        super().__init__('An order can not go from {} to {}'.format(old_status, new_status))
+        self.old_status = old_status
+        self.new_status = new_status
+
+
+def _move(ids, old_status, new_status, user):
+    with transaction.atomic():
+        # orders changed by someone else since they were selected are left out
+        ids = list(
+            Order.objects.select_for_update().filter(id__in=ids, status=old_status).values_list('id', flat=True)
+        )
+        if not ids:
+            return 0
+        Order.objects.filter(id__in=ids).update(status=new_status)
+        OrderStatusChange.objects.bulk_create([
+            OrderStatusChange(order_id=order_id, old_status=old_status, new_status=new_status, changed_by=user)
+            for order_id in ids
+        ])
+        OrderNotification.objects.bulk_create([
+            OrderNotification(order_id=order_id, status=new_status) for order_id in ids
+        ])
+    return len(ids)
+
+
+def transition(orders, new_status, user=None, batch_size=TRANSITION_BATCH_SIZE):
+    """
+    Move the orders of the queryset that are allowed to reach new_status, the
+    others are skipped. Each batch is one UPDATE plus bulk inserts of the history
+    and of the queued customer notifications. Returns the number of moved orders.
+    """
+    if new_status not in STATUS_NAMES:
+        raise InvalidTransition(None, new_status)
+    moved = 0
+    for old_status in (status for status, targets in Order.TRANSITIONS.items() if new_status in targets):
+        last_id = 0
+        while True:
+            ids = list(
+                orders.filter(status=old_status, id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            last_id = ids[-1]
+            moved += _move(ids, old_status, new_status, user)
+    return moved
+
+
+def send_notifications(batch_size=NOTIFICATION_BATCH_SIZE):
+    """
+    Send the queued order e-mails over a single mail connection, one message
+    at a time. Notifications of customers without an e-mail address are
+    marked skipped, not sent. An e-mail the server refuses is tried again on
+    the next runs and skipped after MAX_SEND_ATTEMPTS, it never holds back the
+    others. Returns (sent, skipped, failed).
+    """
+    sent = skipped = failed = 0
+    last_id = 0
+    with get_connection() as connection:
+        while True:
+            batch = list(
+                OrderNotification.objects.filter(
+                    sent_at__isnull=True, skipped_at__isnull=True, id__gt=last_id,
+                ).order_by('id').values_list(
+                    'id', 'order_id', 'status', 'order__first_name', 'order__customer__user__email',
+                )[:batch_size]
+            )
+            if not batch:
+                break
+            last_id = batch[-1][0]
+            sent_ids, no_email, failed_ids = [], [], []
+            try:
+                for notification_id, order_id, status, first_name, email in batch:
+                    if not email:
+                        no_email.append(notification_id)
+                        continue
+                    message = EmailMessage(
+                        'Order #{}: {}'.format(order_id, STATUS_NAMES[status]),
+                        'Hello {}!\n\nThe status of your order #{} is now: {}.\n'.format(
+                            first_name, order_id, STATUS_NAMES[status]),
+                        settings.EMAIL_HOST_USER,
+                        [email],
+                        connection=connection,
+                    )
+                    try:
+                        message.send()
+                    except smtplib.SMTPServerDisconnected:
+                        # the server is gone, the rest stays queued for the next run
+                        raise
+                    except smtplib.SMTPException:
+                        logger.exception('Order e-mail %s to %s failed', notification_id, email)
+                        failed_ids.append(notification_id)
+                    else:
+                        sent_ids.append(notification_id)
+            finally:
+                # what went out is recorded even when the run stops, it is never sent twice
+                now = timezone.now()
+                OrderNotification.objects.filter(id__in=sent_ids).update(sent_at=now)
+                OrderNotification.objects.filter(id__in=no_email).update(skipped_at=now)
+                failures = OrderNotification.objects.filter(id__in=failed_ids)
+                failures.update(attempts=F('attempts') + 1)
+                failures.filter(attempts__gte=MAX_SEND_ATTEMPTS).update(skipped_at=now)
+            sent += len(sent_ids)
+            skipped += len(no_email)
+            failed += len(failed_ids)
+    return sent, skipped, failed
@@ -0,0 +1,246 @@
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import ExpressionWrapper, F, OuterRef, Subquery
+from django.utils import timezone
+
+from . import category_stats, cdn, sitemaps, versions
+from .models import Cart, CartProduct, Product, Promotion, RepriceRequest, ShippingRule
+
+
+RULES_CACHE_KEY = 'web.pricing.rules'
+RULES_CACHE_TIMEOUT = 60 * 60
+REPRICE_BATCH_SIZE = 500
+
+CENT = Decimal('0.01')
+ZERO = Decimal('0.00')
+
+
+@dataclass
+class PriceBreakdown:
+    subtotal: Decimal = ZERO
+    # what the customer saves against old_price, already included in subtotal
+    savings: Decimal = ZERO
+    discount: Decimal = ZERO
+    shipping: Decimal = ZERO
+    total: Decimal = ZERO
+    total_products: int = 0
+    promotion: str = ''
+    # cart product id: final price of the line
+    lines: dict = field(default_factory=dict)
+
+
+# RULES
+def load_rules():
+    """Active shipping rules and promotions, cached until one of them changes."""
+    key = '{}.{}'.format(RULES_CACHE_KEY, versions.get(RULES_CACHE_KEY))
+    rules = cache.get(key)
+    if rules is None:
+        rules = {
+            'shipping': list(
+                ShippingRule.objects.filter(is_active=True).order_by('-min_subtotal').values('min_subtotal', 'price')
+            ),
+            'promotions': list(
+                Promotion.objects.filter(is_active=True).values(
+                    'name', 'kind', 'value', 'category_id', 'product_id', 'min_subtotal', 'starts_at', 'ends_at',
+                )
+            ),
+        }
+        cache.set(key, rules, RULES_CACHE_TIMEOUT)
+    return rules
+
+
+def invalidate_rules():
+    versions.bump(RULES_CACHE_KEY)
+
+
+def _running(promotion, now):
+    return ((promotion['starts_at'] is None or promotion['starts_at'] <= now) and
+            (promotion['ends_at'] is None or now < promotion['ends_at']))
+
+
+def _promotion_discount(promotion, lines, subtotal):
+    if subtotal < promotion['min_subtotal']:
+        return ZERO
+    eligible = sum(
+        (line['final_price'] for line in lines
+         if (promotion['product_id'] is None or promotion['product_id'] == line['product_id']) and
+         (promotion['category_id'] is None or promotion['category_id'] == line['product__category_id'])),
+        ZERO,
+    )
+    if promotion['kind'] == Promotion.KIND_PERCENT:
+        return (eligible * promotion['value'] / 100).quantize(CENT)
+    return min(promotion['value'], eligible) if eligible else ZERO
+
+
+def _shipping(rules, amount):
+    for rule in rules:
+        if amount >= rule['min_subtotal']:
+            return rule['price']
+    return ZERO
+
+
+def _breakdown(lines, rules, now):
+    breakdown = PriceBreakdown(total_products=len(lines))
+    for line in lines:
+        line['final_price'] = line['quantity'] * line['product__price']
+        breakdown.lines[line['id']] = line['final_price']
+        breakdown.subtotal += line['final_price']
+        if line['product__old_price'] > line['product__price']:
+            breakdown.savings += line['quantity'] * (line['product__old_price'] - line['product__price'])
+    if not lines:
+        return breakdown
+
+    # promotions do not stack, the best one for the cart wins
+    for promotion in rules['promotions']:
+        if _running(promotion, now):
+            discount = _promotion_discount(promotion, lines, breakdown.subtotal)
+            if discount > breakdown.discount:
+                breakdown.discount = discount
+                breakdown.promotion = promotion['name']
+    breakdown.shipping = _shipping(rules['shipping'], breakdown.subtotal - breakdown.discount)
+    breakdown.total = (breakdown.subtotal - breakdown.discount + breakdown.shipping).quantize(CENT)
+    return breakdown
+
+
+# ENGINE
+def price_carts(cart_ids):
+    """
+    Price every given cart with a single query over all their lines.
+    Returns {cart id: PriceBreakdown}, carts without lines get an empty breakdown.
+    """
+    rules = load_rules()
+    now = timezone.now()
+    lines_by_cart = {cart_id: [] for cart_id in cart_ids}
+    lines = CartProduct.objects.filter(cart_id__in=lines_by_cart).values(
+        'id', 'cart_id', 'product_id', 'product__category_id', 'product__price', 'product__old_price', 'quantity',
+    )
+    for line in lines:
+        lines_by_cart[line['cart_id']].append(line)
+    return {cart_id: _breakdown(cart_lines, rules, now) for cart_id, cart_lines in lines_by_cart.items()}
+
+
+def price_cart(cart):
+    return price_carts([cart.id])[cart.id]
+
+
+def reprice_carts(cart_ids, batch_size=REPRICE_BATCH_SIZE):
+    """Price the carts in batches and store the new line and cart totals. Returns the number of carts."""
+    cart_ids = list(cart_ids)
+    # quantity * current price, computed by the database for all lines of a batch at once
+    line_price = ExpressionWrapper(
+        F('quantity') * Subquery(Product.objects.filter(id=OuterRef('product_id')).values('price')[:1]),
+        output_field=CartProduct._meta.get_field('final_price'),
+    )
+    for start in range(0, len(cart_ids), batch_size):
+        batch = cart_ids[start:start + batch_size]
+        breakdowns = price_carts(batch)
+        carts = [
+            Cart(
+                id=cart_id,
+                final_price=breakdown.total,
+                shipping_price=breakdown.shipping,
+                total_products=breakdown.total_products,
+            )
+            for cart_id, breakdown in breakdowns.items()
+        ]
+        with transaction.atomic():
+            CartProduct.objects.filter(cart_id__in=batch).update(final_price=line_price)
+            Cart.objects.bulk_update(carts, ['final_price', 'shipping_price', 'total_products'])
+    return len(cart_ids)
+
+
+def reprice_products(product_ids, batch_size=REPRICE_BATCH_SIZE):
+    """Reprice the open carts holding any of the products, e.g. after a price change. Returns the number of carts."""
+    product_ids = list(product_ids)
+    repriced = 0
+    last_id = 0
+    while True:
+        cart_ids = list(
+            Cart.objects.filter(
+                in_order=False, id__gt=last_id, related_products__product_id__in=product_ids,
+            ).order_by('id').values_list('id', flat=True).distinct()[:batch_size]
+        )
+        if not cart_ids:
+            break
+        repriced += reprice_carts(cart_ids, batch_size=batch_size)
+        last_id = cart_ids[-1]
+    return repriced
+
+
+def reprice_open_carts(batch_size=REPRICE_BATCH_SIZE):
+    """Reprice every open cart, e.g. after a promotion or shipping rule change. Returns the number of carts."""
+    repriced = 0
+    last_id = 0
+    while True:
+        cart_ids = list(
+            Cart.objects.filter(in_order=False, id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size]
+        )
+        if not cart_ids:
+            return repriced
+        repriced += reprice_carts(cart_ids, batch_size=batch_size)
+        last_id = cart_ids[-1]
+
+
+def queue_reprice(*product_ids):
+    """
+    Queue the products for reprice_queued(), in the current transaction: a
+    price change never waits for the carts holding the product.
+    """
+    RepriceRequest.objects.bulk_create([RepriceRequest(product_id=product_id) for product_id in set(product_ids)])
+
+
+def queue_reprice_all():
+    """Queue every open cart for reprice_queued(), a request without a product stands for all of them."""
+    RepriceRequest.objects.create(product_id=None)
+
+
+def reprice_queued(batch_size=REPRICE_BATCH_SIZE):
+    """Reprice the open carts of the queued products, or all of them, returns the number of carts."""
+    repriced = 0
+    while True:
+        batch = list(RepriceRequest.objects.order_by('id').values_list('id', 'product_id')[:batch_size])
+        if not batch:
+            return repriced
+        # the rules may have changed a moment ago, the version this process read is not trusted
+        versions.expire(RULES_CACHE_KEY)
+        product_ids = {product_id for _, product_id in batch}
+        if None in product_ids:
+            repriced += reprice_open_carts(batch_size=batch_size)
+        else:
+            repriced += reprice_products(product_ids, batch_size=batch_size)
+        RepriceRequest.objects.filter(id__in=[request_id for request_id, _ in batch]).delete()
+
+
+def update_prices(products, *updates, batch_size=REPRICE_BATCH_SIZE):
+    """
+    Apply the updates, dicts of price field values, to the products in
+    batches. Each update is its own UPDATE statement, run in order, so an
+    update reads the values the previous ones wrote whatever the database.
+    Also done here, as an update sends no signals: the open carts holding the
+    products are queued for repricing, and the category stats, CDN pages and
+    sitemaps of the products are refreshed. Returns the number of products.
+    """
+    updated = 0
+    category_ids = set()
+    last_id = 0
+    while True:
+        rows = list(products.filter(id__gt=last_id).order_by('id').values_list('id', 'category_id')[:batch_size])
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        ids = [product_id for product_id, _ in rows]
+        category_ids.update(category_id for _, category_id in rows)
+        with transaction.atomic():
+            for changes in updates:
+                Product.objects.filter(id__in=ids).update(updated_at=timezone.now(), **changes)
+            updated += len(ids)
+            cdn.purge(*[cdn.product_key(product_id) for product_id in ids])
+            queue_reprice(*ids)
+    if updated:
+        category_stats.rebuild(category_ids)
+        cdn.purge(cdn.PRODUCTS_KEY, cdn.CATEGORIES_KEY, *[cdn.category_key(category_id) for category_id in category_ids])
+        sitemaps.invalidate()
+    return updated
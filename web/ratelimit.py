@@ -0,0 +1,70 @@
+import hashlib
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+
+CACHE_KEY = 'web.ratelimit.{}.{}'
+
+
+def client_id(request):
+    """The signed-in user, else the IP address: a session cookie is chosen by the client, so it is no key."""
+    # requests built outside the middleware stack, e.g. by benchmark_login, have no user
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return 'user:{}'.format(user.pk)
+    # the Heroku router appends the address it got the request from, earlier values come from the client
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+    if forwarded:
+        return 'ip:' + forwarded.split(',')[-1].strip()
+    return 'ip:' + request.META.get('REMOTE_ADDR', '')
+
+
+def take_token(key, rate, burst):
+    """
+    Token bucket kept in the shared cache: it holds up to burst tokens and
+    refills at rate tokens per second. Returns 0 when a token was taken,
+    else the seconds until the next one.
+    Processes racing on one bucket may both get its last token, which is
+    fine for keeping bots off the database.
+    """
+    now = time.time()
+    tokens, updated_at = cache.get(key) or (burst, now)
+    tokens = min(burst, tokens + (now - updated_at) * rate)
+    wait = 0 if tokens >= 1 else (1 - tokens) / rate
+    if not wait:
+        tokens -= 1
+    # a bucket left alone until it is full again is the same as no bucket
+    cache.set(key, (tokens, now), math.ceil((burst - tokens) / rate) + 1)
+    return wait
+
+
+def ratelimit(scope, methods=('POST',), field=None):
+    """
+    View decorator limiting the requests of one client to the RATELIMITS[scope] bucket,
+    given as (requests per minute, burst). Answers 429 once the bucket is empty.
+    With field, the value posted in it, e.g. a username, also gets a bucket of
+    its own, so spreading the requests over many addresses does not help.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if settings.RATELIMIT_ENABLED and request.method in methods:
+                per_minute, burst = settings.RATELIMITS[scope]
+                clients = [client_id(request)]
+                if field and request.POST.get(field):
+                    # hashed, memcached keys can not hold any character a client posts
+                    value = request.POST[field].strip().lower().encode('utf-8')
+                    clients.append('{}:{}'.format(field, hashlib.sha1(value).hexdigest()))
+                wait = max(take_token(CACHE_KEY.format(scope, client), per_minute / 60, burst) for client in clients)
+                if wait:
+                    response = HttpResponse('Too many requests, please try again later.', status=429)
+                    response['Retry-After'] = math.ceil(wait)
+                    return response
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
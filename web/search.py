@@ -0,0 +1,221 @@
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+from datetime import timedelta
+
+from django.urls import reverse
+from django.utils import timezone
+
+from . import versions
+from .models import Category, Product, SearchChange
+
+
+VERSION_CACHE_KEY = 'web.search.version'
+MAX_RESULTS = 10
+# upper bound of matching titles ranked per query, keeps one or two letter prefixes fast
+MAX_CANDIDATES = 200
+# more changes than this since the last check are cheaper to load with a rebuild
+MAX_CHANGES = 1000
+# changes younger than this are replayed again, their ids may have been committed out of order
+CHANGE_SETTLE = timedelta(minutes=1)
+# changes are pruned after this, an index not checked for half of it is rebuilt
+CHANGE_RETENTION = timedelta(days=1)
+
+WORD_RE = re.compile(r'\w+')
+
+KIND_CATEGORY = 'category'
+KIND_PRODUCT = 'product'
+URL_NAMES = {
+    KIND_CATEGORY: 'category_detail',
+    KIND_PRODUCT: 'product_detail',
+}
+
+
+def tokenize(text):
+    return WORD_RE.findall(text.lower())
+
+
+class PrefixIndex:
+    """
+    Word prefix index over category names and product titles.
+    Every word of a title is kept in one sorted list of (word, kind, id)
+    tuples, so all titles having a word starting with a prefix are found
+    with a binary search and a short scan.
+    """
+
+    def __init__(self):
+        self.words = []
+        # (kind, id): (title, slug, words)
+        self.entries = {}
+
+    def add(self, kind, pk, title, slug):
+        self.remove(kind, pk)
+        words = set(tokenize(title))
+        self.entries[kind, pk] = (title, slug, words)
+        for word in words:
+            insort(self.words, (word, kind, pk))
+
+    def remove(self, kind, pk):
+        entry = self.entries.pop((kind, pk), None)
+        if entry:
+            for word in entry[2]:
+                del self.words[bisect_left(self.words, (word, kind, pk))]
+
+    def load(self, entries):
+        # a single sort is much faster than inserting a whole catalog one by one
+        for kind, pk, title, slug in entries:
+            words = set(tokenize(title))
+            self.entries[kind, pk] = (title, slug, words)
+            self.words.extend((word, kind, pk) for word in words)
+        self.words.sort()
+
+    def span(self, prefix):
+        """Positions in words of the words starting with prefix."""
+        return bisect_left(self.words, (prefix,)), bisect_left(self.words, (prefix + '\U0010ffff',))
+
+    def search(self, query, limit=MAX_RESULTS):
+        """
+        Entries having a word starting with every word of the query.
+        Categories come first, then titles starting with the query.
+        """
+        prefixes = set(tokenize(query))
+        if not prefixes:
+            return []
+        spans = {prefix: self.span(prefix) for prefix in prefixes}
+        # the prefix with the fewest words is scanned in full, the others filter its titles
+        first = min(prefixes, key=lambda prefix: spans[prefix][1] - spans[prefix][0])
+        others = prefixes - {first}
+        # a dict keeps the order and drops titles matching with several words
+        keys = {}
+        for position in range(*spans[first]):
+            key = self.words[position][1:]
+            if key in keys:
+                continue
+            if all(any(word.startswith(prefix) for word in self.entries[key][2]) for prefix in others):
+                keys[key] = None
+                if len(keys) >= MAX_CANDIDATES:
+                    break
+        keys = list(keys)
+        query = ' '.join(tokenize(query))
+        keys.sort(key=lambda key: (
+            key[0] != KIND_CATEGORY, not self.entries[key][0].lower().startswith(query), self.entries[key][0],
+        ))
+        return [
+            {
+                'type': kind,
+                'title': self.entries[kind, pk][0],
+                'url': reverse(URL_NAMES[kind], kwargs={'slug': self.entries[kind, pk][1]}),
+            }
+            for kind, pk in keys[:limit]
+        ]
+
+
+def invalidate():
+    """Make every process rebuild its index, after writes that send no signals."""
+    versions.bump(VERSION_CACHE_KEY)
+
+
+def build_index():
+    index = PrefixIndex()
+    index.load(
+        (KIND_CATEGORY, pk, name, slug) for pk, name, slug in Category.objects.values_list('id', 'name', 'slug')
+    )
+    index.load(
+        (KIND_PRODUCT, pk, title, slug)
+        for pk, title, slug in Product.objects.values_list('id', 'title', 'slug').iterator(chunk_size=5000)
+    )
+    return index
+
+
+def settled_change():
+    """Id of the last change every earlier change has surely been committed before."""
+    return SearchChange.objects.filter(
+        created_at__lte=timezone.now() - CHANGE_SETTLE,
+    ).order_by('-id').values_list('id', flat=True).first() or 0
+
+
+class CatalogIndex:
+    """
+    Process wide index, built on first use. Saved and deleted items are
+    logged as SearchChange rows, every process replays the new rows on its
+    next check instead of building the whole index again.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.index = None
+        self.version = None
+        self.last_change = 0
+        self.built_at = 0
+        self.checked_at = 0
+
+    def get(self):
+        now = time.monotonic()
+        if self.index is not None and now - self.checked_at < versions.CHECK_INTERVAL:
+            return self.index
+        with self.lock:
+            version = versions.get(VERSION_CACHE_KEY)
+            stale = now - self.built_at > CHANGE_RETENTION.total_seconds() / 2
+            if self.index is None or version != self.version or stale or not self.replay():
+                self.rebuild()
+                self.version = version
+            self.checked_at = now
+        return self.index
+
+    def rebuild(self):
+        # changes from now on are replayed over the new index, replaying one twice does no harm
+        self.last_change = settled_change()
+        self.index = build_index()
+        self.built_at = time.monotonic()
+        SearchChange.objects.filter(created_at__lt=timezone.now() - CHANGE_RETENTION).delete()
+
+    def replay(self):
+        """Apply the changes logged since the last check, False when there are too many."""
+        changes = list(
+            SearchChange.objects.filter(id__gt=self.last_change).order_by('id')
+            .values_list('id', 'kind', 'item_id', 'created_at')[:MAX_CHANGES + 1]
+        )
+        if len(changes) > MAX_CHANGES:
+            return False
+        ids = {KIND_CATEGORY: set(), KIND_PRODUCT: set()}
+        for _, kind, pk, _ in changes:
+            ids[kind].add(pk)
+        items = {}
+        items.update(
+            ((KIND_CATEGORY, pk), (name, slug))
+            for pk, name, slug in Category.objects.filter(id__in=ids[KIND_CATEGORY]).values_list('id', 'name', 'slug')
+        )
+        items.update(
+            ((KIND_PRODUCT, pk), (title, slug))
+            for pk, title, slug in Product.objects.filter(id__in=ids[KIND_PRODUCT]).values_list('id', 'title', 'slug')
+        )
+        for kind, pks in ids.items():
+            for pk in pks:
+                if (kind, pk) in items:
+                    self.index.add(kind, pk, *items[kind, pk])
+                else:
+                    self.index.remove(kind, pk)
+        settled = timezone.now() - CHANGE_SETTLE
+        self.last_change = max(
+            [self.last_change] + [change_id for change_id, _, _, created_at in changes if created_at <= settled]
+        )
+        return True
+
+    def search(self, query, limit=MAX_RESULTS):
+        index = self.get()
+        with self.lock:
+            return index.search(query, limit)
+
+    def changed(self, kind, pk, title=None, slug=None):
+        """Apply a saved or deleted item here and log it for the other processes."""
+        SearchChange.objects.create(kind=kind, item_id=pk)
+        with self.lock:
+            if self.index is not None:
+                if title is None:
+                    self.index.remove(kind, pk)
+                else:
+                    self.index.add(kind, pk, title, slug)
+
+
+catalog_index = CatalogIndex()
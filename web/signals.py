@@ -0,0 +1,103 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import category_stats, cdn, sitemaps
+from .models import Category, Product, Promotion, ShippingRule
+from .pricing import invalidate_rules, queue_reprice, queue_reprice_all
+from .search import KIND_CATEGORY, KIND_PRODUCT, catalog_index
+
+
+# Pricing rules are cached, drop them whenever a rule changes, the stored cart totals follow
+@receiver(post_save, sender=ShippingRule)
+@receiver(post_delete, sender=ShippingRule)
+@receiver(post_save, sender=Promotion)
+@receiver(post_delete, sender=Promotion)
+def pricing_rules_changed(sender, **kwargs):
+    invalidate_rules()
+    queue_reprice_all()
+
+
+# Sitemaps are cached until the catalog changes
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def catalog_changed(sender, **kwargs):
+    transaction.on_commit(sitemaps.invalidate)
+
+
+# The stored state of a product before it is saved, for the receivers below: a ProductState, None for a new one
+@receiver(pre_save, sender=Product)
+def product_before_save(sender, instance, raw=False, **kwargs):
+    instance._saved_state = None if raw or instance._state.adding else category_stats.saved_state(instance.pk)
+
+
+# Category stats follow every product write, fixtures are counted by rebuild_category_stats
+@receiver(post_save, sender=Product)
+def product_stats_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        category_stats.product_changed(instance._saved_state, category_stats.product_state(instance))
+
+
+@receiver(post_delete, sender=Product)
+def product_stats_deleted(sender, instance, **kwargs):
+    category_stats.product_changed(category_stats.product_state(instance), None)
+
+
+# Open carts follow price changes, a new category may also bring other promotions
+@receiver(post_save, sender=Product)
+def product_price_changed(sender, instance, raw=False, **kwargs):
+    before = instance._saved_state
+    after = category_stats.product_state(instance)
+    if not raw and before and (before.category_id, before.price) != (after.category_id, after.price):
+        queue_reprice(instance.pk)
+
+
+# Autocomplete index
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, **kwargs):
+    transaction.on_commit(lambda: catalog_index.changed(KIND_CATEGORY, instance.pk, instance.name, instance.slug))
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, **kwargs):
+    transaction.on_commit(lambda: catalog_index.changed(KIND_PRODUCT, instance.pk, instance.title, instance.slug))
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: catalog_index.changed(KIND_CATEGORY, pk))
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: catalog_index.changed(KIND_PRODUCT, pk))
+
+
+# CDN purges, only the pages tagged with the changed product or category
+@receiver(post_save, sender=Product)
+def product_purge(sender, instance, **kwargs):
+    before = instance._saved_state
+    keys = [cdn.product_key(instance.pk), cdn.category_key(instance.category_id), cdn.PRODUCTS_KEY]
+    if before and before.category_id != instance.category_id:
+        keys.append(cdn.category_key(before.category_id))
+    if before != category_stats.product_state(instance):
+        # the counts and prices shown in the category menu changed
+        keys.append(cdn.CATEGORIES_KEY)
+    cdn.purge(*keys)
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted_purge(sender, instance, **kwargs):
+    cdn.purge(
+        cdn.product_key(instance.pk), cdn.category_key(instance.category_id), cdn.PRODUCTS_KEY, cdn.CATEGORIES_KEY,
+    )
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_purge(sender, instance, **kwargs):
+    cdn.purge(cdn.category_key(instance.pk), cdn.CATEGORIES_KEY)
@@ -0,0 +1,109 @@
+import math
+import zlib
+from xml.sax.saxutils import escape
+
+from django.core.cache import cache
+from django.db.models import Max
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+
+from . import versions
+from .models import Category, Product
+
+
+# Search engines accept up to 50 000 urls per sitemap, smaller pages keep
+# every cached page well below the memcached item size.
+PAGE_SIZE = 10000
+CHUNK_SIZE = 2000
+CACHE_TIMEOUT = 60 * 60 * 24
+VERSION_CACHE_KEY = 'web.sitemaps.version'
+
+SECTIONS = {
+    'categories': Category,
+    'products': Product,
+}
+
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n'
+URLSET_OPEN = '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+URLSET_CLOSE = '</urlset>\n'
+INDEX_OPEN = '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+INDEX_CLOSE = '</sitemapindex>\n'
+
+
+def invalidate():
+    versions.bump(VERSION_CACHE_KEY)
+
+
+def _cache_key(request, name):
+    version = versions.get(VERSION_CACHE_KEY)
+    return 'web.sitemaps.{}.{}.{}'.format(version, request.get_host(), name)
+
+
+def _entry(tag, location, lastmod):
+    lastmod = '<lastmod>{}</lastmod>'.format(lastmod.date().isoformat()) if lastmod else ''
+    return '<{tag}><loc>{loc}</loc>{lastmod}</{tag}>\n'.format(tag=tag, loc=escape(location), lastmod=lastmod)
+
+
+def _cached_response(key, content):
+    """Stream the content while keeping a compressed copy for the cache."""
+    compressor = zlib.compressobj()
+    compressed = []
+
+    def stream():
+        for part in content:
+            part = part.encode('utf-8')
+            compressed.append(compressor.compress(part))
+            yield part
+        compressed.append(compressor.flush())
+        cache.set(key, b''.join(compressed), CACHE_TIMEOUT)
+
+    return StreamingHttpResponse(stream(), content_type='application/xml')
+
+
+def _from_cache(key):
+    data = cache.get(key)
+    if data is None:
+        return None
+    return HttpResponse(zlib.decompress(data), content_type='application/xml')
+
+
+def index_content(request):
+    yield XML_HEADER
+    yield INDEX_OPEN
+    for section, model in SECTIONS.items():
+        stats = model.objects.aggregate(lastmod=Max('updated_at'))
+        pages = math.ceil(model.objects.count() / PAGE_SIZE)
+        for page in range(1, pages + 1):
+            location = request.build_absolute_uri(reverse('sitemap_section', kwargs={'section': section, 'page': page}))
+            yield _entry('sitemap', location, stats['lastmod'])
+    yield INDEX_CLOSE
+
+
+def section_content(request, model, page):
+    yield XML_HEADER
+    yield URLSET_OPEN
+    items = model.objects.only('slug', 'updated_at').order_by('pk')[(page - 1) * PAGE_SIZE:page * PAGE_SIZE]
+    base = request.build_absolute_uri('/')[:-1]
+    for item in items.iterator(chunk_size=CHUNK_SIZE):
+        yield _entry('url', base + item.get_absolute_url(), item.updated_at)
+    yield URLSET_CLOSE
+
+
+# sitemap.xml
+def sitemap_index(request):
+    key = _cache_key(request, 'index')
+    return _from_cache(key) or _cached_response(key, index_content(request))
+
+
+# sitemap-<section>-<page>.xml
+def sitemap_section(request, section, page):
+    model = SECTIONS.get(section)
+    if model is None or page < 1:
+        raise Http404
+    key = _cache_key(request, '{}.{}'.format(section, page))
+    response = _from_cache(key)
+    if response is None:
+        if page > 1 and not model.objects.order_by('pk')[(page - 1) * PAGE_SIZE:].exists():
+            raise Http404
+        response = _cached_response(key, section_content(request, model, page))
+    return response
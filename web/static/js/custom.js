@@ -430,6 +430,30 @@
   }
   
   
+  // Search Autocomplete JS
+  let searchInput = $("#search[data-autocomplete-url]"),
+    searchSuggestions = searchInput.siblings(".search-suggestions"),
+    searchTimer;
+
+  searchInput.on('input', function() {
+    clearTimeout(searchTimer);
+    let query = $.trim(searchInput.val());
+    if (query.length < 2) {
+      searchSuggestions.removeClass("show").empty();
+      return;
+    }
+    searchTimer = setTimeout(function() {
+      $.getJSON(searchInput.data('autocomplete-url'), {q: query}, function(data) {
+        searchSuggestions.empty();
+        $.each(data.results, function(i, result) {
+          searchSuggestions.append($("<li>").append($("<a>").attr('href', result.url).text(result.title)));
+        });
+        searchSuggestions.toggleClass("show", data.results.length > 0);
+      });
+    }, 150);
+  });
+
+
 /* ==========================================================================
    When document is loading, do
    ========================================================================== */
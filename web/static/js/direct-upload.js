@@ -0,0 +1,43 @@
+// Uploads the chosen image straight to the media storage, the admin form only posts its name
+(function () {
+  "use strict";
+
+  function upload(container, file) {
+    var target = document.getElementById(container.dataset.target);
+    var status = container.querySelector('.direct-upload-status');
+    var query = '?filename=' + encodeURIComponent(file.name) + '&content_type=' + encodeURIComponent(file.type);
+    status.textContent = 'Uploading...';
+    fetch(container.dataset.presignUrl + query, {credentials: 'same-origin'})
+      .then(function (response) {
+        if (!response.ok) {
+          throw new Error('Could not start the upload');
+        }
+        return response.json();
+      })
+      .then(function (upload) {
+        var data = new FormData();
+        Object.keys(upload.fields).forEach(function (key) {
+          data.append(key, upload.fields[key]);
+        });
+        // the storage expects the file after the policy fields
+        data.append('file', file);
+        return fetch(upload.url, {method: 'POST', body: data, credentials: 'same-origin'}).then(function (response) {
+          if (!response.ok) {
+            throw new Error('The upload failed');
+          }
+          target.value = upload.name;
+          status.textContent = 'Uploaded ' + file.name;
+        });
+      })
+      .catch(function (error) {
+        status.textContent = error.message;
+      });
+  }
+
+  document.addEventListener('change', function (event) {
+    var container = event.target.closest('.direct-upload');
+    if (container && event.target.files && event.target.files.length) {
+      upload(container, event.target.files[0]);
+    }
+  });
+})();
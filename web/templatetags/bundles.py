@@ -0,0 +1,20 @@
+from django import template
+from django.conf import settings
+from django.templatetags.static import static
+from django.utils.html import format_html_join
+
+
+register = template.Library()
+
+TAGS = {
+    '.css': '<link href="{}" rel="stylesheet"/>',
+    '.js': '<script src="{}"></script>',
+}
+
+
+# Renders one tag for a STATIC_BUNDLES entry, or a tag per source file in DEBUG
+@register.simple_tag
+def bundle(name):
+    names = settings.STATIC_BUNDLES[name] if settings.DEBUG else [name]
+    tag = TAGS[name[name.rfind('.'):]]
+    return format_html_join('\n', tag, ((static(item),) for item in names))
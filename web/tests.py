@@ -1,3 +1,887 @@
-from django.test import TestCase
+import json
+import smtplib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import AnonymousUser, Permission, User
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.mail import EmailMessage
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import F, Sum
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from mysite.storages import LocalMediaStore
+
+from . import category_stats, cdn, inventory, media, orders, pricing, sitemaps
+from .models import (
+    Cart, CartProduct, Category, CategoryStats, CdnPurge, Customer, InventoryCheckpoint, Order, OrderNotification,
+    OrderStatusChange, Product, Promotion, RelatedProduct, RepriceRequest, ShippingRule, StockMovement,
+)
+from .pricing import price_cart
+from .ratelimit import client_id
+from .uploads import HEADER_SIZES, header_dimensions, image_dimensions
+
+
+def create_product(category, slug, price, old_price=0, availability=5):
+    return Product.objects.create(
+        title=slug.replace('-', ' ').title(), slug=slug, description='For testing', category=category,
+        price=Decimal(price), old_price=Decimal(old_price), availability=availability,
+        thumbnail_image='img/{}.jpg'.format(slug), big_image='img/{}-big.jpg'.format(slug),
+    )
+
+
+def create_cart(*lines):
+    """Open cart of a new customer holding (product, quantity) lines."""
+    customer = Customer.objects.create(user=User.objects.create_user('buyer{}'.format(User.objects.count())))
+    cart = Cart.objects.create(owner=customer)
+    for product, quantity in lines:
+        CartProduct.objects.create(customer=customer, cart=cart, product=product, quantity=quantity)
+    return cart
+
+
+class PriceCartTests(TestCase):
+
+    def setUp(self):
+        # the pricing rules are cached, a rolled back test may leave its rules behind
+        cache.clear()
+        self.bikes = Category.objects.create(name='Bikes', slug='bikes')
+        self.parts = Category.objects.create(name='Parts', slug='parts')
+        self.bike = create_product(self.bikes, 'trail-bike', '100.00', old_price='120.00')
+        self.chain = create_product(self.parts, 'chain', '20.00')
+        ShippingRule.objects.create(name='Standard', min_subtotal=0, price=Decimal('10.00'))
+        ShippingRule.objects.create(name='Free', min_subtotal=Decimal('150.00'), price=0)
+
+    def test_without_promotions(self):
+        breakdown = price_cart(create_cart((self.bike, 2), (self.chain, 1)))
+        self.assertEqual(breakdown.subtotal, Decimal('220.00'))
+        self.assertEqual(breakdown.savings, Decimal('40.00'))
+        self.assertEqual(breakdown.discount, 0)
+        self.assertEqual(breakdown.shipping, 0)
+        self.assertEqual(breakdown.total, Decimal('220.00'))
+        self.assertEqual(breakdown.total_products, 2)
+
+    def test_shipping_below_threshold(self):
+        breakdown = price_cart(create_cart((self.bike, 1)))
+        self.assertEqual(breakdown.shipping, Decimal('10.00'))
+        self.assertEqual(breakdown.total, Decimal('110.00'))
+
+    def test_best_promotion_wins(self):
+        Promotion.objects.create(name='Bikes 10%', value=10, category=self.bikes)
+        Promotion.objects.create(name='5 off', kind=Promotion.KIND_FIXED, value=5)
+        breakdown = price_cart(create_cart((self.bike, 2), (self.chain, 1)))
+        self.assertEqual(breakdown.promotion, 'Bikes 10%')
+        self.assertEqual(breakdown.discount, Decimal('20.00'))
+        self.assertEqual(breakdown.total, Decimal('200.00'))
+
+    def test_discount_counts_for_shipping(self):
+        # 160 is free to ship, 160 - 16 is not
+        Promotion.objects.create(name='All 10%', value=10)
+        breakdown = price_cart(create_cart((self.bike, 1), (self.chain, 3)))
+        self.assertEqual(breakdown.discount, Decimal('16.00'))
+        self.assertEqual(breakdown.shipping, Decimal('10.00'))
+        self.assertEqual(breakdown.total, Decimal('154.00'))
+
+    def test_promotion_minimum_subtotal(self):
+        Promotion.objects.create(name='Big carts', kind=Promotion.KIND_FIXED, value=50, min_subtotal=500)
+        breakdown = price_cart(create_cart((self.bike, 2)))
+        self.assertEqual(breakdown.discount, 0)
+        self.assertEqual(breakdown.promotion, '')
+
+    def test_rule_changes_apply_at_once(self):
+        cart = create_cart((self.bike, 1))
+        self.assertEqual(price_cart(cart).shipping, Decimal('10.00'))
+        ShippingRule.objects.filter(name='Standard').update(price=Decimal('7.00'))
+        # a queryset update sends no signal, saving one does
+        ShippingRule.objects.get(name='Free').save()
+        self.assertEqual(price_cart(cart).shipping, Decimal('7.00'))
+
+    def test_empty_cart(self):
+        breakdown = price_cart(create_cart())
+        self.assertEqual(breakdown.total, 0)
+        self.assertEqual(breakdown.shipping, 0)
+
+
+class InventoryTests(TestCase):
+
+    def setUp(self):
+        category = Category.objects.create(name='Bikes', slug='bikes')
+        self.product = create_product(category, 'trail-bike', '100.00', availability=8)
+
+    def available(self):
+        return self.product.stock_shards.aggregate(total=Sum('available'))['total']
+
+    def test_take(self):
+        inventory.take(self.product.id, 1)
+        self.assertEqual(self.product.stock_shards.count(), inventory.SHARDS)
+        self.assertEqual(self.available(), 7)
+        self.assertEqual(
+            list(StockMovement.objects.values_list('kind', 'quantity')), [(StockMovement.KIND_SALE, -1)],
+        )
+
+    def test_take_across_shards(self):
+        # one item per shard, no single shard holds three
+        inventory.take(self.product.id, 3)
+        self.assertEqual(self.available(), 5)
+
+    def test_out_of_stock(self):
+        inventory.take(self.product.id, 6)
+        with self.assertRaises(inventory.OutOfStock) as raised:
+            inventory.take(self.product.id, 3)
+        self.assertEqual((raised.exception.product_id, raised.exception.quantity), (self.product.id, 3))
+        self.assertEqual(self.available(), 2)
+        self.assertEqual(StockMovement.objects.count(), 1)
+
+    def test_put(self):
+        inventory.take(self.product.id, 8)
+        inventory.put(self.product.id, 2, kind=StockMovement.KIND_RETURN)
+        inventory.take(self.product.id, 2)
+        with self.assertRaises(inventory.OutOfStock):
+            inventory.take(self.product.id, 1)
+
+    def test_fold(self):
+        inventory.take(self.product.id, 3)
+        self.assertEqual(inventory.fold(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.availability, 5)
+        self.assertEqual(self.product.category.stats.in_stock_count, 1)
+
+    def test_fold_sold_out(self):
+        inventory.take(self.product.id, 8)
+        inventory.fold()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.availability, 0)
+        self.assertEqual(self.product.category.stats.in_stock_count, 0)
+
+    def test_fold_checkpoint_margin(self):
+        inventory.take(self.product.id, 1)
+        inventory.fold()
+        # recent movements may still be followed by lower ids committing, they are folded again
+        self.assertEqual(InventoryCheckpoint.objects.get().last_movement_id, 0)
+        self.assertEqual(inventory.fold(), 1)
+        movement = StockMovement.objects.get()
+        StockMovement.objects.update(created_at=timezone.now() - inventory.FOLD_MARGIN * 2)
+        inventory.fold()
+        self.assertEqual(InventoryCheckpoint.objects.get().last_movement_id, movement.id)
+        self.assertEqual(inventory.fold(), 0)
+
+    def test_worker_folds(self):
+        inventory.take(self.product.id, 1)
+        call_command('run_worker', '--once', stdout=StringIO())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.availability, 7)
+
+    def test_adjust(self):
+        inventory.take(self.product.id, 2)
+        self.assertEqual(inventory.adjust(self.product.id, 10), 4)
+        self.assertEqual(self.available(), 10)
+        self.assertEqual(inventory.adjust(self.product.id, 10), 0)
+        inventory.fold()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.availability, 10)
+
+
+class CategoryStatsTests(TestCase):
+
+    def setUp(self):
+        self.bikes = Category.objects.create(name='Bikes', slug='bikes')
+        self.parts = Category.objects.create(name='Parts', slug='parts')
+        self.bike = create_product(self.bikes, 'trail-bike', '100.00')
+        self.cheap_bike = create_product(self.bikes, 'city-bike', '50.00', old_price='60.00', availability=0)
+        self.chain = create_product(self.parts, 'chain', '20.00')
+
+    def stats(self, category):
+        """(products, in stock, on sale, lowest price, highest price), checked against a recount."""
+        fields = ('product_count', 'in_stock_count', 'sale_count', 'min_price', 'max_price')
+        kept = CategoryStats.objects.values_list(*fields).get(category=category)
+        category_stats.rebuild([category.id])
+        self.assertEqual(kept, CategoryStats.objects.values_list(*fields).get(category=category))
+        return kept
+
+    def test_created(self):
+        self.assertEqual(self.stats(self.bikes), (2, 1, 1, Decimal('50.00'), Decimal('100.00')))
+        self.assertEqual(self.stats(self.parts), (1, 1, 0, Decimal('20.00'), Decimal('20.00')))
+
+    def test_price_moves(self):
+        self.cheap_bike.price = Decimal('150.00')
+        self.cheap_bike.save()
+        # the lowest price goes to the other product, the sale ends
+        self.assertEqual(self.stats(self.bikes), (2, 1, 0, Decimal('100.00'), Decimal('150.00')))
+
+    def test_sale_starts(self):
+        self.bike.old_price = Decimal('100.00')
+        self.bike.price = Decimal('80.00')
+        self.bike.save()
+        self.assertEqual(self.stats(self.bikes), (2, 1, 2, Decimal('50.00'), Decimal('80.00')))
+
+    def test_category_moves(self):
+        self.bike.category = self.parts
+        self.bike.price = Decimal('10.00')
+        self.bike.save()
+        self.assertEqual(self.stats(self.bikes), (1, 0, 1, Decimal('50.00'), Decimal('50.00')))
+        self.assertEqual(self.stats(self.parts), (2, 2, 0, Decimal('10.00'), Decimal('20.00')))
+
+    def test_last_product_leaves(self):
+        self.chain.category = self.bikes
+        self.chain.save()
+        self.assertEqual(self.stats(self.parts), (0, 0, 0, None, None))
+        self.assertEqual(self.stats(self.bikes), (3, 2, 1, Decimal('20.00'), Decimal('100.00')))
+
+    def test_deleted(self):
+        self.bike.delete()
+        self.assertEqual(self.stats(self.bikes), (1, 0, 1, Decimal('50.00'), Decimal('50.00')))
+
+    def test_unchanged_state(self):
+        # decimals read back from the database equal the ones the product was saved with
+        saved = category_stats.saved_state(self.bike.id)
+        self.assertEqual(saved, category_stats.product_state(self.bike))
+        self.assertEqual(saved.category_id, self.bikes.id)
+        with self.assertNumQueries(0):
+            category_stats.product_changed(saved, category_stats.product_state(self.bike))
+
+
+# the login page is rendered, without a manifest from collectstatic
+@override_settings(
+    RATELIMIT_ENABLED=True, RATELIMITS={'login': (10, 5)},
+    STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage',
+)
+class RateLimitTests(TestCase):
+
+    def setUp(self):
+        # the token buckets are in the cache
+        cache.clear()
+
+    def anonymous_request(self, **extra):
+        request = RequestFactory().get('/', **extra)
+        request.user = AnonymousUser()
+        return request
+
+    def test_client_id_anonymous(self):
+        self.assertEqual(client_id(self.anonymous_request(REMOTE_ADDR='10.0.0.1')), 'ip:10.0.0.1')
+        # the router appends the address it saw, the earlier ones are the client's
+        request = self.anonymous_request(REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR='1.2.3.4, 5.6.7.8')
+        self.assertEqual(client_id(request), 'ip:5.6.7.8')
+
+    def test_client_id_ignores_session_cookie(self):
+        request = self.anonymous_request(REMOTE_ADDR='10.0.0.1', HTTP_COOKIE='sessionid=anything')
+        self.assertEqual(client_id(request), 'ip:10.0.0.1')
+
+    def test_client_id_without_user(self):
+        # built by hand, no authentication middleware ran
+        self.assertEqual(client_id(RequestFactory().get('/', REMOTE_ADDR='10.0.0.1')), 'ip:10.0.0.1')
+
+    def test_client_id_user(self):
+        request = RequestFactory().get('/', REMOTE_ADDR='10.0.0.1')
+        request.user = User.objects.create_user('rider')
+        self.assertEqual(client_id(request), 'user:{}'.format(request.user.pk))
+
+    def login(self, username, address):
+        self.client.cookies.clear()
+        return self.client.post(reverse('login'), {'username': username, 'password': 'wrong'}, REMOTE_ADDR=address)
+
+    def test_limited_per_address(self):
+        for attempt in range(5):
+            self.assertEqual(self.login('rider{}'.format(attempt), '10.0.0.1').status_code, 200)
+        response = self.login('rider9', '10.0.0.1')
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        self.assertEqual(self.login('rider9', '10.0.0.2').status_code, 200)
+
+    def test_limited_per_username(self):
+        for attempt in range(5):
+            self.assertEqual(self.login('rider', '10.0.0.{}'.format(attempt)).status_code, 200)
+        self.assertEqual(self.login(' Rider', '10.0.0.9').status_code, 429)
+        self.assertEqual(self.login('other', '10.0.0.9').status_code, 200)
+
+    def test_get_not_limited(self):
+        for _ in range(10):
+            self.assertEqual(self.client.get(reverse('login'), REMOTE_ADDR='10.0.0.1').status_code, 200)
+
+
+class ApiEtagTests(TestCase):
+
+    def setUp(self):
+        category = Category.objects.create(name='Bikes', slug='bikes')
+        self.product = create_product(category, 'trail-bike', '100.00', availability=5)
+        create_product(category, 'city-bike', '50.00')
+
+    def assertRevalidates(self, url, change):
+        """304 for the current ETag, then a new body and ETag once change() ran."""
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        change()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        return response.json()
+
+    def sell_out(self):
+        # fold() writes availability with an update, updated_at stays the same
+        inventory.take(self.product.id, 5)
+        inventory.fold()
+
+    def test_product(self):
+        data = self.assertRevalidates(reverse('api_product', kwargs={'slug': 'trail-bike'}), self.sell_out)
+        self.assertEqual(data['availability'], 0)
+
+    def test_products(self):
+        data = self.assertRevalidates(reverse('api_products') + '?fields=slug,availability', self.sell_out)
+        self.assertEqual(data['results'], [
+            {'slug': 'trail-bike', 'availability': 0}, {'slug': 'city-bike', 'availability': 5},
+        ])
+
+    def test_categories(self):
+        data = self.assertRevalidates(reverse('api_categories'), self.sell_out)
+        self.assertEqual(data['results'][0]['in_stock_count'], 1)
+
+    def test_unrelated_change(self):
+        url = reverse('api_product', kwargs={'slug': 'trail-bike'})
+        etag = self.client.get(url)['ETag']
+        Product.objects.filter(slug='city-bike').update(availability=0)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+
+class RepriceTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.bikes = Category.objects.create(name='Bikes', slug='bikes')
+        self.bike = create_product(self.bikes, 'trail-bike', '100.00')
+        self.chain = create_product(self.bikes, 'chain', '20.00')
+        self.cart = create_cart((self.bike, 2))
+        self.other_cart = create_cart((self.chain, 1))
+        self.ordered_cart = create_cart((self.bike, 1))
+        Cart.objects.filter(id=self.ordered_cart.id).update(in_order=True)
+        pricing.reprice_carts([self.cart.id, self.other_cart.id, self.ordered_cart.id])
+        RepriceRequest.objects.all().delete()
+
+    def final_prices(self):
+        return [
+            Cart.objects.get(id=cart.id).final_price for cart in (self.cart, self.other_cart, self.ordered_cart)
+        ]
+
+    def test_reprice_products(self):
+        Product.objects.filter(id=self.bike.id).update(price=Decimal('90.00'))
+        self.assertEqual(pricing.reprice_products([self.bike.id]), 1)
+        # ordered carts keep the prices they were bought at
+        self.assertEqual(self.final_prices(), [Decimal('180.00'), Decimal('20.00'), Decimal('100.00')])
+        self.assertEqual(CartProduct.objects.get(cart=self.cart).final_price, Decimal('180.00'))
+
+    def test_price_edit_is_queued(self):
+        self.bike.price = Decimal('80.00')
+        self.bike.save()
+        self.assertEqual(list(RepriceRequest.objects.values_list('product_id', flat=True)), [self.bike.id])
+        self.assertEqual(self.final_prices()[0], Decimal('200.00'))
+        self.assertEqual(pricing.reprice_queued(), 1)
+        self.assertEqual(self.final_prices(), [Decimal('160.00'), Decimal('20.00'), Decimal('100.00')])
+        self.assertFalse(RepriceRequest.objects.exists())
+
+    def test_update_prices(self):
+        # the sale: old_price is set first, the new price is computed from it
+        updated = pricing.update_prices(
+            Product.objects.filter(old_price__lte=F('price')),
+            {'old_price': F('price')}, {'price': F('old_price') * 80 / 100},
+            batch_size=1,
+        )
+        self.assertEqual(updated, 2)
+        self.assertEqual(
+            list(Product.objects.order_by('id').values_list('price', 'old_price')),
+            [(Decimal('80.00'), Decimal('100.00')), (Decimal('16.00'), Decimal('20.00'))],
+        )
+        self.assertEqual(self.bikes.stats.sale_count, 2)
+        pricing.reprice_queued()
+        self.assertEqual(self.final_prices(), [Decimal('160.00'), Decimal('16.00'), Decimal('100.00')])
+
+    def test_rule_change_reprices_open_carts(self):
+        Promotion.objects.create(name='All 10%', value=10)
+        self.assertTrue(RepriceRequest.objects.filter(product_id=None).exists())
+        self.assertEqual(pricing.reprice_queued(), 2)
+        self.assertEqual(self.final_prices(), [Decimal('180.00'), Decimal('18.00'), Decimal('100.00')])
+
+    def test_reprice_all_command(self):
+        Product.objects.update(price=Decimal('10.00'))
+        call_command('reprice_carts', '--all', stdout=StringIO())
+        self.assertEqual(self.final_prices(), [Decimal('20.00'), Decimal('10.00'), Decimal('100.00')])
+
+    def test_worker(self):
+        self.chain.price = Decimal('30.00')
+        self.chain.save()
+        call_command('run_worker', '--once', stdout=StringIO())
+        self.assertEqual(self.final_prices()[1], Decimal('30.00'))
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage', CDN_MAX_AGE=600)
+class CdnTests(TestCase):
+
+    def setUp(self):
+        self.bikes = Category.objects.create(name='Bikes', slug='bikes')
+        self.bike = create_product(self.bikes, 'trail-bike', '100.00')
+        CdnPurge.objects.all().delete()
+
+    def purged_keys(self):
+        return set(CdnPurge.objects.values_list('key', flat=True))
+
+    def test_anonymous_page_is_tagged(self):
+        response = self.client.get(self.bike.get_absolute_url())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            set(response['Surrogate-Key'].split()),
+            {cdn.product_key(self.bike.id), cdn.category_key(self.bikes.id)},
+        )
+        self.assertIn('Cookie', response['Vary'])
+        self.assertEqual(response['Surrogate-Control'], 'max-age=600')
+        self.assertFalse(response.cookies)
+
+    def test_pages_with_cookies_are_not_tagged(self):
+        self.client.cookies['sessionid'] = 'anything'
+        self.assertNotIn('Surrogate-Key', self.client.get(self.bike.get_absolute_url()))
+        self.client.cookies.clear()
+        self.client.force_login(User.objects.create_user('rider'))
+        self.assertNotIn('Surrogate-Key', self.client.get(self.bike.get_absolute_url()))
+
+    def test_save_queues_purge(self):
+        parts = Category.objects.create(name='Parts', slug='parts')
+        CdnPurge.objects.all().delete()
+        self.bike.category = parts
+        self.bike.save()
+        self.assertEqual(self.purged_keys(), {
+            cdn.product_key(self.bike.id), cdn.category_key(parts.id), cdn.category_key(self.bikes.id),
+            cdn.PRODUCTS_KEY, cdn.CATEGORIES_KEY,
+        })
+
+    def test_fold_queues_purge(self):
+        inventory.take(self.bike.id, 1)
+        inventory.fold()
+        self.assertEqual(self.purged_keys(), {
+            cdn.product_key(self.bike.id), cdn.category_key(self.bikes.id), cdn.PRODUCTS_KEY, cdn.CATEGORIES_KEY,
+        })
+
+    def test_send_purges(self):
+        cdn.purge('a', 'b')
+        cdn.purge('b')
+        self.assertEqual(cdn.send_purges(), 2)
+        self.assertEqual(cdn.LocalPurgeBackend.purged[-1], ['a', 'b'])
+        self.assertFalse(CdnPurge.objects.exists())
+
+    def test_failed_purge_stays_queued(self):
+        cdn.purge('a')
+        backend = mock.Mock(**{'purge.side_effect': OSError('CDN down')})
+        with mock.patch.object(cdn, 'get_backend', return_value=backend), self.assertLogs('web.cdn'):
+            self.assertEqual(cdn.send_purges(), 0)
+        self.assertEqual(self.purged_keys(), {'a'})
+
+
+def create_order(email='rider@example.com', status=Order.STATUS_NEW, **fields):
+    user = User.objects.create_user('customer{}'.format(User.objects.count()), email=email)
+    return Order.objects.create(
+        customer=Customer.objects.create(user=user), first_name='Anna', last_name='Volkova',
+        phone_number='+70000000000', status=status, **fields
+    )
+
+
+class OrderTests(TestCase):
+
+    def test_transition(self):
+        new, ready = create_order(), create_order(status=Order.STATUS_READY)
+        staff = User.objects.create_user('staff')
+        self.assertEqual(orders.transition(Order.objects.all(), Order.STATUS_IN_PROGRESS, user=staff), 1)
+        new.refresh_from_db()
+        ready.refresh_from_db()
+        self.assertEqual((new.status, ready.status), (Order.STATUS_IN_PROGRESS, Order.STATUS_READY))
+        self.assertEqual(
+            list(OrderStatusChange.objects.values_list('order_id', 'old_status', 'new_status', 'changed_by')),
+            [(new.id, Order.STATUS_NEW, Order.STATUS_IN_PROGRESS, staff.id)],
+        )
+        self.assertEqual(list(OrderNotification.objects.values_list('order_id', flat=True)), [new.id])
+
+    def test_transition_in_batches(self):
+        created = [create_order() for _ in range(5)]
+        self.assertEqual(orders.transition(Order.objects.all(), Order.STATUS_READY, batch_size=2), 5)
+        self.assertEqual(OrderNotification.objects.count(), len(created))
+        self.assertEqual(orders.transition(Order.objects.all(), Order.STATUS_READY), 0)
+
+    def test_unknown_status(self):
+        with self.assertRaises(orders.InvalidTransition):
+            orders.transition(Order.objects.all(), 'lost')
+
+    def test_send_notifications(self):
+        for email in ('anna@example.com', '', 'ivan@example.com'):
+            orders.transition(Order.objects.filter(id=create_order(email=email).id), Order.STATUS_READY)
+        self.assertEqual(orders.send_notifications(batch_size=2), (2, 1, 0))
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ['anna@example.com', 'ivan@example.com'])
+        self.assertEqual(OrderNotification.objects.filter(skipped_at__isnull=False).count(), 1)
+        self.assertEqual(orders.send_notifications(), (0, 0, 0))
+
+    def test_refused_address_does_not_block_the_queue(self):
+        for email in ('bad@example.com', 'anna@example.com'):
+            orders.transition(Order.objects.filter(id=create_order(email=email).id), Order.STATUS_READY)
+        send = EmailMessage.send
+
+        def refuse(message, *args, **kwargs):
+            if message.to == ['bad@example.com']:
+                raise smtplib.SMTPRecipientsRefused({'bad@example.com': (550, b'No such user')})
+            return send(message, *args, **kwargs)
+
+        with mock.patch.object(EmailMessage, 'send', autospec=True, side_effect=refuse), \
+                self.assertLogs('web.orders'):
+            self.assertEqual(orders.send_notifications(), (1, 0, 1))
+            for _ in range(orders.MAX_SEND_ATTEMPTS - 1):
+                orders.send_notifications()
+        self.assertEqual([message.to for message in mail.outbox], [['anna@example.com']])
+        refused = OrderNotification.objects.get(order__customer__user__email='bad@example.com')
+        self.assertEqual(refused.attempts, orders.MAX_SEND_ATTEMPTS)
+        self.assertIsNotNone(refused.skipped_at)
+        self.assertIsNone(refused.sent_at)
+
+
+class MigrationTestCase(TransactionTestCase):
+    """
+    Data is created with the models of migrate_from, then migrate() runs the
+    migrations up to migrate_to. The database is migrated to the latest state
+    again afterwards.
+    """
+    migrate_from = migrate_to = None
+
+    def setUp(self):
+        executor = MigrationExecutor(connection)
+        self.latest = executor.loader.graph.leaf_nodes()
+        executor.migrate([self.migrate_from])
+        self.old_apps = executor.loader.project_state([self.migrate_from]).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.latest)
+
+    def migrate(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate([self.migrate_to])
+        return executor.loader.project_state([self.migrate_to]).apps
+
+    def create_customer(self, username):
+        user = self.old_apps.get_model('auth', 'User').objects.create(username=username)
+        return self.old_apps.get_model('web', 'Customer').objects.create(user=user)
+
+
+class CustomerOrdersMigrationTests(MigrationTestCase):
+    migrate_from = ('web', '0014_auto_20261019_1844')
+    migrate_to = ('web', '0015_remove_customer_orders')
+
+    def test_join_rows_dropped(self):
+        Order = self.old_apps.get_model('web', 'Order')
+        anna, ivan = self.create_customer('anna'), self.create_customer('ivan')
+        order = Order.objects.create(customer=anna, first_name='Anna', last_name='Volkova', phone_number='1')
+        # a join row pointing to another customer than Order.customer
+        anna.orders.add(order)
+        ivan.orders.add(order)
+        apps = self.migrate()
+        self.assertEqual(apps.get_model('web', 'Order').objects.get().customer_id, anna.id)
+        self.assertNotIn('orders', [field.name for field in apps.get_model('web', 'Customer')._meta.get_fields()])
+
+
+class CartProductsMigrationTests(MigrationTestCase):
+    migrate_from = ('web', '0015_remove_customer_orders')
+    migrate_to = ('web', '0016_remove_cart_products')
+
+    def test_lines_follow_join_rows(self):
+        Cart = self.old_apps.get_model('web', 'Cart')
+        CartProduct = self.old_apps.get_model('web', 'CartProduct')
+        Category = self.old_apps.get_model('web', 'Category')
+        Product = self.old_apps.get_model('web', 'Product')
+        customer = self.create_customer('anna')
+        product = Product.objects.create(
+            title='Bike', slug='bike', description='Bike', price=100,
+            category=Category.objects.create(name='Bikes', slug='bikes'),
+        )
+        first, second = Cart.objects.create(owner=customer), Cart.objects.create(owner=customer)
+        kept = CartProduct.objects.create(customer=customer, cart=first, product=product)
+        moved = CartProduct.objects.create(customer=customer, cart=first, product=product)
+        first.products.add(kept)
+        second.products.add(moved)
+        apps = self.migrate()
+        lines = apps.get_model('web', 'CartProduct').objects.order_by('id').values_list('id', 'cart_id')
+        self.assertEqual(list(lines), [(kept.id, first.id), (moved.id, second.id)])
+
+
+def jpeg(size=(360, 480), **options):
+    content = BytesIO()
+    Image.new('RGB', size, (200, 30, 30)).save(content, 'JPEG', **options)
+    return content.getvalue()
+
+
+class ImageDimensionsTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.location = directory.name
+
+    def stored(self, storage, data):
+        name = storage.save('img/test.jpg', ContentFile(data))
+        return SimpleNamespace(_committed=True, storage=storage, name=name)
+
+    def test_header(self):
+        self.assertEqual(header_dimensions(jpeg()[:1024]), (360, 480))
+        self.assertEqual(header_dimensions(b'not an image'), (None, None))
+
+    def test_large_metadata(self):
+        # the ICC profile comes before the frame header
+        data = jpeg(icc_profile=b'\0' * 200000)
+        self.assertEqual(header_dimensions(data[:HEADER_SIZES[0]]), (None, None))
+        self.assertEqual(image_dimensions(self.stored(LocalMediaStore(location=self.location), data)), (360, 480))
+
+    def test_storage_without_ranged_reads(self):
+        data = jpeg(icc_profile=b'\0' * 200000)
+        self.assertEqual(image_dimensions(self.stored(FileSystemStorage(location=self.location), data)), (360, 480))
+
+    def test_not_an_image(self):
+        image = self.stored(LocalMediaStore(location=self.location), b'not an image')
+        self.assertEqual(image_dimensions(image), (None, None))
+
+
+def photo(size=(360, 480), orientation=None, **options):
+    """A JPEG with some detail, as a camera would store it."""
+    image = Image.linear_gradient('L').resize(size).convert('RGB')
+    exif = Image.Exif()
+    if orientation:
+        exif[0x0112] = orientation
+    content = BytesIO()
+    image.save(content, 'JPEG', quality=98, exif=exif.tobytes(), **options)
+    return content.getvalue()
+
+
+class MediaTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.storage = LocalMediaStore(location=directory.name)
+        # the images are read in threads instead of spawned processes, which would not see the test storage
+        for patch in (
+            mock.patch.object(media, 'default_storage', self.storage),
+            mock.patch.object(media, '_worker_storage', lambda: self.storage),
+            mock.patch.object(media, 'ProcessPoolExecutor', lambda workers, **options: ThreadPoolExecutor(workers)),
+        ):
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.bikes = Category.objects.create(name='Bikes', slug='bikes')
+        self.trail = create_product(self.bikes, 'trail-bike', '100.00')
+        self.road = create_product(self.bikes, 'road-bike', '100.00')
+        CdnPurge.objects.all().delete()
+        self.data = photo()
+        for name in ('img/trail-bike.jpg', 'img/trail-bike-big.jpg', 'img/road-bike.jpg', 'img/road-bike-big.jpg'):
+            self.storage.save(name, ContentFile(self.data))
+
+    def test_optimize_keeps_orientation_and_profile(self):
+        profile = b'profile' * 100
+        # orientation 6: the camera was turned, the picture is shown rotated by 90 degrees
+        data = photo(size=(480, 360), orientation=6, icc_profile=profile)
+        optimized = Image.open(BytesIO(media.optimize(data)))
+        self.assertEqual(optimized.size, (360, 480))
+        self.assertEqual(optimized.info.get('icc_profile'), profile)
+        self.assertNotIn(0x0112, optimized.getexif())
+
+    def test_optimize_not_smaller(self):
+        self.assertEqual(media.optimize(b'not an image'), b'not an image')
+        content = BytesIO()
+        Image.effect_noise((360, 480), 64).save(content, 'JPEG', quality=50, optimize=True)
+        data = content.getvalue()
+        self.assertEqual(media.optimize(data, quality=100), data)
+
+    def test_dedup(self):
+        totals = media.dedup(workers=2)
+        original = media.content_name(self.data, 'photo.jpg')
+        variant = media.variant_name(original)
+        self.assertEqual(totals['images'], 4)
+        self.assertEqual(totals['errors'], 0)
+        self.assertEqual(totals['written'], len(self.data) + self.storage.size(variant))
+        self.assertEqual(
+            set(Product.objects.values_list('thumbnail_image', 'big_image')), {(variant, variant)},
+        )
+        self.assertEqual(sorted(self.storage.listdir('img/')[1]), [original[len('img/'):]])
+        with self.storage.open(original) as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertEqual(
+            set(CdnPurge.objects.values_list('key', flat=True)),
+            {cdn.product_key(self.trail.id), cdn.product_key(self.road.id)},
+        )
+        # everything is under its content name, nothing is read again
+        self.assertEqual(media.dedup(workers=2)['images'], 0)
+
+    def test_dry_run(self):
+        totals = media.dedup(workers=2, dry_run=True)
+        self.assertEqual(totals['images'], 4)
+        self.assertEqual(totals['deleted'], 4 * len(self.data))
+        self.assertLess(totals['served'], totals['read'])
+        self.assertEqual(
+            set(Product.objects.values_list('thumbnail_image', 'big_image')),
+            {('img/trail-bike.jpg', 'img/trail-bike-big.jpg'), ('img/road-bike.jpg', 'img/road-bike-big.jpg')},
+        )
+        self.assertEqual(len(self.storage.listdir('img/')[1]), 4)
+        self.assertFalse(self.storage.exists(media.VARIANT_DIR))
+
+
+class ExportTests(TestCase):
+
+    def setUp(self):
+        bikes = Category.objects.create(name='Bikes', slug='bikes')
+        self.bike = create_product(bikes, 'trail-bike', '100.00')
+        self.august = create_order(order_date=date(2021, 8, 31), cart=create_cart((self.bike, 2)))
+        self.september = create_order(order_date=date(2021, 9, 1), status=Order.STATUS_READY)
+        self.staff = User.objects.create_user('staff', is_staff=True)
+        self.url = reverse('admin:web_order_export')
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = '{}/orders.csv'.format(directory)
+            call_command('export_orders', output, '--date-to', '2021-08-31', stdout=StringIO())
+            with open(output, newline='', encoding='utf-8') as f:
+                lines = f.read().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[0].startswith('order_id,created_at,order_date,'))
+        self.assertTrue(lines[1].startswith('{},'.format(self.august.id)))
+        self.assertIn(',trail-bike,Trail Bike,2,', lines[1])
+
+    def test_view(self):
+        self.staff.user_permissions.add(Permission.objects.get(codename='view_order'))
+        self.client.force_login(self.staff)
+        response = self.client.get(self.url, {'date_from': '2021-09-01', 'format': 'jsonl'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        orders = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([(order['order_id'], order['status'], order['lines']) for order in orders],
+                         [(self.september.id, Order.STATUS_READY, [])])
+
+    def test_invalid_filters(self):
+        self.staff.user_permissions.add(Permission.objects.get(codename='view_order'))
+        self.client.force_login(self.staff)
+        response = self.client.get(self.url, {'date_from': '2021-09-01', 'date_to': '2021-08-01'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'date_from': 'yesterday'}).status_code, 400)
+
+    def test_staff_without_permission(self):
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+
+class PurgeCartsTests(TestCase):
+
+    def test_purge(self):
+        bike = create_product(Category.objects.create(name='Bikes', slug='bikes'), 'trail-bike', '100.00')
+        abandoned, fresh, ordered = create_cart((bike, 2)), create_cart((bike, 1)), create_cart((bike, 1))
+        Cart.objects.filter(id=ordered.id).update(in_order=True)
+        create_order(cart=ordered)
+        Cart.objects.exclude(id=fresh.id).update(updated_at=timezone.now() - timedelta(days=31))
+        with tempfile.TemporaryDirectory() as directory:
+            archive = '{}/carts.jsonl'.format(directory)
+            call_command('purge_carts', '--archive', archive, '--chunk-size', '1', '--sleep', '0', stdout=StringIO())
+            with open(archive, encoding='utf-8') as f:
+                archived = [json.loads(line) for line in f]
+        self.assertEqual(set(Cart.objects.values_list('id', flat=True)), {fresh.id, ordered.id})
+        self.assertFalse(CartProduct.objects.filter(cart_id=abandoned.id).exists())
+        self.assertEqual([cart['id'] for cart in archived], [abandoned.id])
+        self.assertEqual([(line['product_id'], line['quantity']) for line in archived[0]['lines']], [(bike.id, 2)])
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class RecommendationTests(TestCase):
+
+    def setUp(self):
+        bikes = Category.objects.create(name='Bikes', slug='bikes')
+        self.a, self.b, self.c, self.d = (create_product(bikes, slug, '100.00') for slug in 'abcd')
+        for products in ((self.a, self.b), (self.a, self.b), (self.a, self.c)):
+            self.order(*products)
+        # open carts are not learned from
+        create_cart((self.a, 1), (self.d, 1))
+
+    def order(self, *products):
+        cart = create_cart(*[(product, 1) for product in products])
+        Cart.objects.filter(id=cart.id).update(in_order=True)
+        return create_order(cart=cart)
+
+    def related(self):
+        return {
+            product.slug: [row.related.slug for row in product.bought_together.order_by('rank')]
+            for product in Product.objects.all()
+        }
+
+    def test_build(self):
+        call_command('build_recommendations', stdout=StringIO())
+        self.assertEqual(self.related(), {'a': ['b', 'c'], 'b': ['a'], 'c': ['a'], 'd': []})
+        self.assertEqual(RelatedProduct.objects.get(product=self.a, related=self.b).score, 2)
+        response = self.client.get(self.a.get_absolute_url())
+        self.assertEqual(list(response.context['bought_together']), [self.b, self.c])
+
+    def test_top(self):
+        call_command('build_recommendations', '--top', '1', stdout=StringIO())
+        self.assertEqual(self.related()['a'], ['b'])
+
+    def test_since_days(self):
+        call_command('build_recommendations', stdout=StringIO())
+        Order.objects.update(created_at=timezone.now() - timedelta(days=10))
+        RelatedProduct.objects.filter(product=self.b).delete()
+        self.order(self.c, self.d)
+        call_command('build_recommendations', '--since-days', '1', stdout=StringIO())
+        # only the products of the new order are refreshed, from all their ordered carts
+        self.assertEqual(self.related(), {'a': ['b', 'c'], 'b': [], 'c': ['a', 'd'], 'd': ['c']})
+
+
+@mock.patch.object(sitemaps, 'PAGE_SIZE', 2)
+class SitemapTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        bikes = Category.objects.create(name='Bikes', slug='bikes')
+        self.products = [create_product(bikes, 'bike-{}'.format(number), '100.00') for number in range(5)]
+
+    def get(self, url):
+        response = self.client.get(url)
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, content.decode()
+
+    def test_index(self):
+        response, content = self.get(reverse('sitemap'))
+        self.assertEqual(response.status_code, 200)
+        for section, page in (('categories', 1), ('products', 1), ('products', 2), ('products', 3)):
+            self.assertIn('/sitemap-{}-{}.xml</loc>'.format(section, page), content)
+        self.assertNotIn('/sitemap-products-4.xml', content)
+
+    def test_pages(self):
+        urls = []
+        for page in (1, 2, 3):
+            response, content = self.get(reverse('sitemap_section', kwargs={'section': 'products', 'page': page}))
+            self.assertEqual(response.status_code, 200)
+            urls.extend(content.count('<url>') * [page])
+        self.assertEqual(urls, [1, 1, 2, 2, 3])
+        _, content = self.get(reverse('sitemap_section', kwargs={'section': 'products', 'page': 3}))
+        self.assertIn('http://testserver{}</loc>'.format(self.products[4].get_absolute_url()), content)
+
+    def test_missing_pages(self):
+        for section, page in (('products', 4), ('products', 0), ('orders', 1)):
+            response = self.client.get(reverse('sitemap_section', kwargs={'section': section, 'page': page}))
+            self.assertEqual(response.status_code, 404)
+
+    def test_cached_until_catalog_changes(self):
+        url = reverse('sitemap_section', kwargs={'section': 'products', 'page': 3})
+        response, content = self.get(url)
+        self.assertTrue(response.streaming)
+        response, cached = self.get(url)
+        self.assertFalse(response.streaming)
+        self.assertEqual(cached, content)
+        with self.captureOnCommitCallbacks(execute=True):
+            create_product(self.products[0].category, 'bike-5', '100.00')
+        _, content = self.get(url)
+        self.assertEqual(content.count('<url>'), 2)
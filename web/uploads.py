@@ -0,0 +1,121 @@
+import os
+import uuid
+
+from django import forms
+from django.conf import settings
+from django.core.files.images import get_image_dimensions
+from django.core.files.storage import default_storage
+from django.http import Http404, HttpResponse, JsonResponse
+from django.utils.text import get_valid_filename
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from PIL import Image, ImageFile
+
+
+# JPEG and PNG keep their size within the first few kilobytes, unless big EXIF or ICC
+# segments come first: then a larger start of the file is read
+HEADER_SIZES = (64 * 1024, 1024 * 1024, 16 * 1024 * 1024)
+UPLOAD_DIR = 'img/'
+UPLOAD_EXPIRES = 60 * 60
+
+
+def header_dimensions(data):
+    """(width, height) read from the start of an image file, (None, None) when it is not there."""
+    parser = ImageFile.Parser()
+    try:
+        parser.feed(data)
+    except Exception:
+        return None, None
+    if parser.image is None:
+        return None, None
+    return parser.image.size
+
+
+def image_dimensions(image):
+    """Dimensions of an ImageField file, stored files are not downloaded to get them."""
+    if not image._committed:
+        # a file posted through the form, already on the dyno
+        return get_image_dimensions(image.file)
+    storage = image.storage
+    if hasattr(storage, 'read_header'):
+        for size in HEADER_SIZES:
+            data = storage.read_header(image.name, size)
+            dimensions = header_dimensions(data)
+            # a shorter read is the whole file
+            if dimensions != (None, None) or len(data) < size:
+                return dimensions
+        return None, None
+    with storage.open(image.name) as f:
+        try:
+            # only the header is decoded
+            return Image.open(f).size
+        except Exception:
+            return None, None
+
+
+def upload_name(filename):
+    # every upload gets a new key, so the browser never overwrites a stored image
+    return '{}{}-{}'.format(UPLOAD_DIR, uuid.uuid4().hex, get_valid_filename(os.path.basename(filename)))
+
+
+def presign(filename, content_type):
+    name = upload_name(filename)
+    upload = default_storage.presigned_upload(name, content_type, settings.IMAGE_UPLOAD_MAX_SIZE, UPLOAD_EXPIRES)
+    return dict(upload, name=name)
+
+
+# admin/web/product/upload/?filename=&content_type=
+def presign_view(request):
+    filename = request.GET.get('filename', '')
+    content_type = request.GET.get('content_type', '')
+    if not filename or not content_type.startswith('image/'):
+        return JsonResponse({'error': 'An image file is expected'}, status=400)
+    return JsonResponse(presign(filename, content_type))
+
+
+# Receives the direct uploads of LocalMediaStore, the policy field authorizes them instead of a CSRF token
+@csrf_exempt
+@require_POST
+def local_upload(request):
+    receive_upload = getattr(default_storage, 'receive_upload', None)
+    if receive_upload is None:
+        raise Http404
+    receive_upload(request.POST, request.FILES.get('file'))
+    return HttpResponse(status=204)
+
+
+class DirectUploadInput(forms.HiddenInput):
+    """
+    Keeps the storage name of the image, a file input next to it uploads the
+    chosen file straight to the storage and puts the new name in.
+    """
+    template_name = 'web/widgets/direct_upload.html'
+    input_type = 'hidden'
+
+    class Media:
+        js = ('js/direct-upload.js',)
+
+    def __init__(self, presign_url, attrs=None):
+        super().__init__(attrs)
+        self.presign_url = presign_url
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context['widget']['presign_url'] = self.presign_url
+        context['widget']['url'] = default_storage.url(value) if value else ''
+        return context
+
+
+class DirectUploadField(forms.CharField):
+    """Storage name of an image uploaded by the browser, its content is checked by the model."""
+
+    def __init__(self, presign_url, **kwargs):
+        super().__init__(widget=DirectUploadInput(presign_url), **kwargs)
+
+    def prepare_value(self, value):
+        return getattr(value, 'name', value)
+
+    def validate(self, value):
+        super().validate(value)
+        if value and not (value.startswith(UPLOAD_DIR) and default_storage.exists(value)):
+            raise forms.ValidationError('The image was not uploaded.')
@@ -1,6 +1,6 @@
 from django.urls import path
 from django.contrib.auth import views as auth_views
-from . import views
+from . import api, metrics, sitemaps, uploads, views
 from .views import (
     ProductDetailView,
     CategoryDetailView,
@@ -24,6 +24,20 @@ urlpatterns = [
     path('shop', views.shop, name='shop'),
     path('shop/products/<str:slug>/', ProductDetailView.as_view(), name='product_detail'),
     path('shop/category/<str:slug>/', CategoryDetailView.as_view(), name='category_detail'),
+    path('search/autocomplete', views.autocomplete, name='autocomplete'),
+    path('media-upload/', uploads.local_upload, name='local_upload'),
+
+    # sitemaps
+    path('sitemap.xml', sitemaps.sitemap_index, name='sitemap'),
+    path('sitemap-<slug:section>-<int:page>.xml', sitemaps.sitemap_section, name='sitemap_section'),
+
+    # read-only catalog api
+    path('api/categories', api.categories, name='api_categories'),
+    path('api/products', api.products, name='api_products'),
+    path('api/products/<str:slug>', api.product, name='api_product'),
+
+    # monitoring
+    path('metrics', metrics.metrics_view, name='metrics'),
 
     # other info
     path('about', views.about, name='about'),
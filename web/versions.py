@@ -0,0 +1,44 @@
+import time
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import CacheVersion
+
+
+# how long a process trusts a version it read, the most a change can take to reach every process
+CHECK_INTERVAL = 5
+
+# name: (version, read at)
+_known = {}
+
+
+def get(name):
+    """
+    Current version of the named data, to put in its cache keys. Kept in the
+    database, so a bump reaches every process whatever the cache backend is,
+    e.g. one LocMemCache per gunicorn worker.
+    """
+    now = time.monotonic()
+    if name in _known and now - _known[name][1] < CHECK_INTERVAL:
+        return _known[name][0]
+    version = CacheVersion.objects.filter(name=name).values_list('version', flat=True).first() or 0
+    _known[name] = (version, now)
+    return version
+
+
+def expire(name):
+    """Read the version from the database again on the next get(), for work that must see a bump at once."""
+    _known.pop(name, None)
+
+
+def bump(name):
+    """Move the named data to a new version, visible to the other processes once the transaction commits."""
+    if not CacheVersion.objects.filter(name=name).update(version=F('version') + 1):
+        try:
+            with transaction.atomic():
+                CacheVersion.objects.create(name=name)
+        except IntegrityError:
+            # created by another process meanwhile
+            CacheVersion.objects.filter(name=name).update(version=F('version') + 1)
+    expire(name)
@@ -1,9 +1,10 @@
 from django.db import transaction, OperationalError
-from django.db.models import Q
-from django.shortcuts import render
+from django.db.models import Prefetch, Q
+from django.shortcuts import get_object_or_404, render
+from django.utils.decorators import method_decorator
 from django.views.generic import DetailView, View
-from django.http import HttpResponseRedirect
-from django.contrib.auth import authenticate, login, logout
+from django.http import HttpResponseRedirect, JsonResponse
+from django.contrib.auth import login, logout
 from django.contrib import messages
 from django.template.defaulttags import register
 from django.core.mail import EmailMessage
@@ -15,6 +16,12 @@ from .models import Product, Customer, Cart, CartProduct, Category, Order
 from .mixins import CartMixin
 from .forms import OrderForm, LoginForm, RegistrationForm, ContactForm
 from .utils import recalc_cart
+from .pricing import price_cart
+from .search import catalog_index
+from .inventory import OutOfStock, take
+from .ratelimit import ratelimit
+from .metrics import CART_MUTATIONS, CHECKOUTS
+from . import cdn
 from decouple import config as cfg
 
 
@@ -27,7 +34,7 @@ def get_range(value):
 def index(request):
     products_for_home_page = []
     if Category.objects.all():
-        categories = Category.objects.all()
+        categories = Category.objects.select_related('stats')
         context = {
             'products': Product.objects.all(),
             'categories': categories,
@@ -37,7 +44,7 @@ def index(request):
     else:
         context = {}
 
-    return render(request, 'web/index.html', context=context)
+    return cdn.tag(render(request, 'web/index.html', context=context), cdn.PRODUCTS_KEY, cdn.CATEGORIES_KEY)
 
 
 # ###### CATEGORY VIEWS ###### #
@@ -45,7 +52,7 @@ def index(request):
 class CategoryDetailView(CartMixin, DetailView):
 
     model = Category
-    queryset = Category.objects.all()
+    queryset = Category.objects.select_related('stats')
     context_object_name = 'category'
     slug_url_kwarg = 'slug'
 
@@ -54,7 +61,7 @@ class CategoryDetailView(CartMixin, DetailView):
         query = self.request.GET.get('search')
         category = self.get_object()
         context['cart'] = self.cart
-        context['categories'] = self.model.objects.all()
+        context['categories'] = self.queryset.all()
         if not query and not self.request.GET:
             context['category_products'] = category.product_set.all()
             return context
@@ -76,18 +83,29 @@ class CategoryDetailView(CartMixin, DetailView):
                 q_condition_queries.add(Q(**{'value': value}), Q.OR)
         return context
 
+    def render_to_response(self, context, **response_kwargs):
+        response = super().render_to_response(context, **response_kwargs)
+        return cdn.tag(response, cdn.category_key(self.object.pk), cdn.CATEGORIES_KEY)
+
 
 # ###### SHOP VIEWS ###### #
 # shop page
 def shop(request):
-    categories = Category.objects.all()
+    categories = Category.objects.select_related('stats')
 
     context = {
         'products': Product.objects.all(),
         'categories': categories,
 
     }
-    return render(request, 'web/shop.html', context=context)
+    return cdn.tag(render(request, 'web/shop.html', context=context), cdn.PRODUCTS_KEY, cdn.CATEGORIES_KEY)
+
+
+# Search suggestions for the header search box, served from memory
+def autocomplete(request):
+    query = request.GET.get('q', '').strip()
+    results = catalog_index.search(query) if len(query) >= 2 else []
+    return JsonResponse({'results': results})
 
 
 # Product detail page
@@ -100,43 +118,56 @@ class ProductDetailView(CartMixin, DetailView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data()
         context['cart'] = self.cart
+        # precomputed by the build_recommendations command
+        context['bought_together'] = Product.objects.filter(
+            recommended_for__product=self.object
+        ).order_by('recommended_for__rank')
         return context
 
+    def render_to_response(self, context, **response_kwargs):
+        response = super().render_to_response(context, **response_kwargs)
+        keys = [cdn.product_key(self.object.pk), cdn.category_key(self.object.category_id)]
+        keys += [cdn.product_key(product.pk) for product in context['bought_together']]
+        return cdn.tag(response, *keys)
+
 
 # ###### CART VIEWS ###### #
 # Add to cart
+# cart changes are POST only, so crawlers and link prefetchers can not write carts
+@method_decorator(ratelimit('cart'), name='dispatch')
 class AddToCartView(CartMixin, View):
 
-    def get(self, request, *args, **kwargs):
+    def post(self, request, *args, **kwargs):
         product_slug = kwargs.get('slug')
-        product = Product.objects.get(slug=product_slug)
-        cart_product, created = CartProduct.objects.get_or_create(
+        product = get_object_or_404(Product, slug=product_slug)
+        CartProduct.objects.get_or_create(
             customer=self.cart.owner,
             cart=self.cart,
             product=product,
         )
-        if created:
-            self.cart.products.add(cart_product)
         recalc_cart(self.cart)
+        CART_MUTATIONS.labels('add').inc()
         return HttpResponseRedirect('/cart/')
 
 
+@method_decorator(ratelimit('cart'), name='dispatch')
 class DeleteFromCartView(CartMixin, View):
 
-    def get(self, request, *args, **kwargs):
+    def post(self, request, *args, **kwargs):
         product_slug = kwargs.get('slug')
-        product = Product.objects.get(slug=product_slug)
+        product = get_object_or_404(Product, slug=product_slug)
         cart_product = CartProduct.objects.get(
             customer=self.cart.owner,
             cart=self.cart,
             product=product,
         )
-        self.cart.products.remove(cart_product)
         cart_product.delete()
         recalc_cart(self.cart)
+        CART_MUTATIONS.labels('remove').inc()
         return HttpResponseRedirect('/cart/')
 
 
+@method_decorator(ratelimit('cart'), name='dispatch')
 class ChangeQTYView(CartMixin, View):
 
     def post(self, request, *args, **kwargs):
@@ -151,6 +182,7 @@ class ChangeQTYView(CartMixin, View):
         cart_product.quantity = qty
         cart_product.save()
         recalc_cart(self.cart)
+        CART_MUTATIONS.labels('change_qty').inc()
         return HttpResponseRedirect('/cart/')
 
 
@@ -161,7 +193,9 @@ class CartView(CartMixin, View):
         categories = Category.objects.all()
         context = {
             'cart': self.cart,
-            'categories': categories
+            'lines': self.cart.related_products.select_related('product').order_by('id'),
+            'categories': categories,
+            'breakdown': price_cart(self.cart),
         }
         return render(request, 'web/shop-cart.html', context=context)
 
@@ -174,8 +208,10 @@ class CheckoutView(CartMixin, View):
         form = OrderForm(request.POST or None)
         context = {
             'cart': self.cart,
+            'lines': self.cart.related_products.select_related('product').order_by('id'),
             'categories': categories,
             'form': form,
+            'breakdown': price_cart(self.cart),
         }
         return render(request, 'web/shop-checkout.html', context=context)
 
@@ -203,12 +239,27 @@ class MakeOrderView(CartMixin, View):
                 new_order.cart = self.cart
                 new_order.save()
 
-                customer.orders.add(new_order)
+                # product order keeps concurrent checkouts from locking products in opposite orders,
+                # within a product take() does not wait on shards held by another checkout
+                lines = self.cart.related_products.order_by('product_id').values_list('product_id', 'quantity')
+                try:
+                    for product_id, quantity in lines:
+                        take(product_id, quantity, order=new_order)
+                except OutOfStock as error:
+                    product = Product.objects.get(id=error.product_id)
+                    transaction.set_rollback(True)
+                    CHECKOUTS.labels('out_of_stock').inc()
+                    messages.info(request, f"Sorry, there are not enough {product.title} left in stock!")
+                    return HttpResponseRedirect('/cart/')
+
+                CHECKOUTS.labels('success').inc()
                 messages.info(request, "Thank you for your order! Hope to see you here again!")
                 return HttpResponseRedirect('/')
+            CHECKOUTS.labels('invalid_form').inc()
             messages.info(request, "There is some error! Check if you entered data correctly!")
             return HttpResponseRedirect('/shop-checkout')
         except OperationalError:
+            CHECKOUTS.labels('error').inc()
             return render(request, 'web/page-not-found.html')
 
 
@@ -228,23 +279,16 @@ class RegistrationView(View):
     def post(self, request, *args, **kwargs):
         form = RegistrationForm(request.POST or None)
         if form.is_valid():
-            new_user = form.save(commit=False)
-            new_user.username = form.cleaned_data['username']
-            new_user.email = form.cleaned_data['email']
-            new_user.first_name = form.cleaned_data['first_name']
-            new_user.last_name = form.cleaned_data['last_name']
-            new_user.save()
-            new_user.set_password(form.cleaned_data['password'])
-            new_user.save()
-            Customer.objects.create(
-                user=new_user,
-                phone_number=form.cleaned_data['phone_number'],
-            )
-            user = authenticate(
-                  username=form.cleaned_data['username'],
-                  password=form.cleaned_data['password']
-            )
-            login(request, user)
+            with transaction.atomic():
+                new_user = form.save(commit=False)
+                new_user.set_password(form.cleaned_data['password'])
+                new_user.save()
+                Customer.objects.create(
+                    user=new_user,
+                    phone_number=form.cleaned_data['phone_number'],
+                )
+            # the user was just created with this password, no need to authenticate() it again
+            login(request, new_user)
             return HttpResponseRedirect('/')
 
         context = {
@@ -255,6 +299,7 @@ class RegistrationView(View):
 
 
 # Login page
+@method_decorator(ratelimit('login', field='username'), name='dispatch')
 class LoginView(View):
 
     def get(self, request, *args, **kwargs):
@@ -269,15 +314,8 @@ class LoginView(View):
     def post(self, request, *args, **kwargs):
         form = LoginForm(request.POST or None)
         if form.is_valid():
-            username = form.cleaned_data['username']
-            password = form.cleaned_data['password']
-            user = authenticate(
-                username=username,
-                password=password
-            )
-            if user:
-                login(request, user)
-                return HttpResponseRedirect('/')
+            login(request, form.get_user())
+            return HttpResponseRedirect('/')
         context = {
             'form': form,
         }
@@ -293,7 +331,9 @@ class ProfileView(CartMixin, View):
 
     def get(self, request, *args, **kwargs):
         customer = Customer.objects.get(user=request.user)
-        orders = Order.objects.filter(customer=customer).order_by('-created_at')
+        orders = Order.objects.filter(customer=customer).select_related('cart').prefetch_related(
+            Prefetch('cart__related_products', CartProduct.objects.select_related('product').order_by('id'))
+        ).order_by('-created_at')
         categories = Category.objects.all()
         context = {
             'orders': orders,
@@ -312,6 +352,7 @@ def about(request):
 
 
 # contact page
+@ratelimit('contact')
 def contact(request):
     if request.method == 'POST':
         name = request.POST.get('full-name')
@@ -0,0 +1,75 @@
+import logging
+import time
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.files.storage import default_storage
+from django.db import connections
+from django.template import engines
+from django.urls import resolve, reverse
+
+from .pricing import load_rules
+from .search import catalog_index
+
+
+logger = logging.getLogger(__name__)
+
+
+def urls():
+    # the first resolve and reverse build the resolver's lookup tables
+    resolve('/')
+    reverse('index')
+
+
+def templates():
+    """Compile every template of the web app, the cached loader keeps them for the process."""
+    engine = engines['django']
+    root = Path(apps.get_app_config('web').path) / 'templates'
+    for path in root.rglob('*.html'):
+        name = path.relative_to(root).as_posix()
+        try:
+            engine.get_template(name)
+        except Exception:
+            logger.warning('Could not compile template %s', name, exc_info=True)
+
+
+def storages():
+    # imports the storage backends and reads the static files manifest
+    default_storage.url('warmup')
+    for name in settings.STATIC_BUNDLES:
+        staticfiles_storage.url(name)
+
+
+def catalog():
+    catalog_index.get()
+    load_rules()
+
+
+STEPS = (
+    ('urls', urls),
+    ('templates', templates),
+    ('storages', storages),
+    ('catalog', catalog),
+)
+
+
+def warm_up():
+    """
+    Do the work the first requests of a new worker would otherwise pay for.
+    Returns the seconds spent per step, a failing step is logged and skipped.
+    """
+    timings = {}
+    for name, step in STEPS:
+        start = time.perf_counter()
+        try:
+            step()
+        except Exception:
+            logger.exception('Warm-up step %s failed', name)
+        timings[name] = time.perf_counter() - start
+    # the worker's requests open their own connections
+    connections.close_all()
+    logger.info('Warmed up in %.2fs (%s)', sum(timings.values()),
+                ', '.join('{} {:.2f}s'.format(name, seconds) for name, seconds in timings.items()))
+    return timings